@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Offline benchmarks for the fetch, probe, prune and build stages.
+
+Starts the stand-ins from bench/stand_in.py, then runs each stage at each
+size in a fresh subprocess (so peak RSS is per stage) and reports throughput,
+p50/p99 latency and peak RSS. Results are written as JSON to
+bench/results/<timestamp>-<commit>.json for comparison across commits.
+
+Sizes are DAYSxEVENTSxCHANNELS (channels per event):
+    python bench/run_bench.py --sizes 2x10x3 7x50x8 --stages fetch probe
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stand_in import DEFAULT_BEHAVIOUR, ApiServer, ChannelHost  # noqa: E402
+
+STAGES = ['fetch', 'probe', 'prune', 'build', 'build_sharded']
+DEFAULT_SIZES = ['2x10x3', '4x25x5', '7x50x8']
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def synthetic_report(channels):
+    results = []
+    for i, url in enumerate(channels):
+        results.append({
+            'url': url,
+            'final_url': url,
+            'status': 503 if i % 20 == 0 else 200,
+            'is_https': i % 3 != 0,
+            'x_frame_options': 'SAMEORIGIN' if i % 10 == 0 else None,
+            'csp_frame_ancestors': None,
+            'referrer_meta': True,
+            'etag': None,
+            'last_modified': None,
+            'error': None,
+        })
+    return {'results': results}
+
+
+def run_stage(stage, api_url, iterations, probe_opts):
+    """Run one stage in this (child) process and return its measurements."""
+    import check_headers
+    import generate
+    import prune_channels
+
+    generate.API_URL = api_url
+    baseline = peak_rss_kb()
+    latencies = []
+    items = 0
+    tmp = tempfile.mkdtemp(prefix='bench-')
+    quiet = io.StringIO()
+    with contextlib.redirect_stdout(quiet):
+        data = generate.fetch_api()
+        channels = generate.extract_channels(data, limit=0)
+        t_start = time.perf_counter()
+        if stage == 'fetch':
+            for _ in range(iterations):
+                t = time.perf_counter()
+                items += len(generate.fetch_channels(limit=0))
+                latencies.append(time.perf_counter() - t)
+        elif stage == 'probe':
+            original = check_headers.probe_url
+
+            def timed(url, *args, **kwargs):
+                t = time.perf_counter()
+                try:
+                    return original(url, *args, **kwargs)
+                finally:
+                    latencies.append(time.perf_counter() - t)
+
+            check_headers.probe_url = timed
+            t_start = time.perf_counter()
+            for _ in range(iterations):
+                items += len(check_headers.probe_many(channels, **probe_opts))
+        elif stage == 'prune':
+            report = os.path.join(tmp, 'embed_report.json')
+            with open(report, 'w', encoding='utf-8') as fh:
+                json.dump(synthetic_report(channels), fh, indent=2)
+            t_start = time.perf_counter()
+            for _ in range(iterations):
+                t = time.perf_counter()
+                prune_channels.main(report=report, out=os.path.join(tmp, 'pruned_channels.json'))
+                latencies.append(time.perf_counter() - t)
+                items += len(channels)
+        elif stage == 'build':
+            for _ in range(iterations):
+                t = time.perf_counter()
+                generate.build_html(channels, tmp, force=True)
+                latencies.append(time.perf_counter() - t)
+                items += len(channels)
+        elif stage == 'build_sharded':
+            days = generate.extract_events(data, limit=0)
+            t_start = time.perf_counter()
+            for _ in range(iterations):
+                t = time.perf_counter()
+                generate.build_sharded(days, tmp, force=True)
+                latencies.append(time.perf_counter() - t)
+                items += len(channels)
+        else:
+            raise ValueError(f'unknown stage {stage}')
+        wall = time.perf_counter() - t_start
+    return {
+        'items': items,
+        'wall_s': round(wall, 4),
+        'throughput_per_s': round(items / wall, 1) if wall > 0 else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'samples': len(latencies),
+        'baseline_rss_kb': baseline,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def _child(queue, *args):
+    try:
+        queue.put(run_stage(*args))
+    except Exception as exc:
+        queue.put({'error': repr(exc)})
+
+
+def parse_size(text):
+    days, events, channels = (int(x) for x in text.lower().split('x'))
+    return {'days': days, 'events': events, 'channels': channels, 'total': days * events * channels}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='DAYSxEVENTSxCHANNELS per run')
+    p.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    p.add_argument('--iterations', type=int, default=5, help='repetitions per stage (probe runs once per iteration)')
+    p.add_argument('--probe-iterations', type=int, default=1)
+    p.add_argument('--hosts', type=int, default=4, help='number of stand-in channel hosts')
+    p.add_argument('--concurrency', type=int, default=16)
+    p.add_argument('--per-host', type=int, default=4)
+    for key, value in DEFAULT_BEHAVIOUR.items():
+        p.add_argument('--' + key.replace('_', '-'), type=type(value), default=value)
+    p.add_argument('--output', help='result file (default bench/results/<timestamp>-<commit>.json)')
+    args = p.parse_args()
+
+    behaviour = {k: getattr(args, k) for k in DEFAULT_BEHAVIOUR}
+    hosts = [ChannelHost(**behaviour).start() for _ in range(args.hosts)]
+    probe_opts = {'concurrency': args.concurrency, 'per_host': args.per_host}
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for size_text in args.sizes:
+            size = parse_size(size_text)
+            api = ApiServer(size['days'], size['events'], size['channels'], [h.base_url for h in hosts]).start()
+            try:
+                for stage in args.stages:
+                    iterations = args.probe_iterations if stage == 'probe' else args.iterations
+                    queue = ctx.Queue()
+                    proc = ctx.Process(target=_child, args=(queue, stage, api.api_url, iterations, probe_opts))
+                    proc.start()
+                    row = queue.get()
+                    proc.join()
+                    row = dict({'stage': stage, 'size': size, 'iterations': iterations}, **row)
+                    results.append(row)
+                    if 'error' in row:
+                        print(f'{stage:<14} {size_text:<10} ERROR {row["error"]}')
+                    else:
+                        print(f'{stage:<14} {size_text:<10} {row["throughput_per_s"]:>10} items/s  '
+                              f'p50 {row["p50_ms"]:>9} ms  p99 {row["p99_ms"]:>9} ms  peak RSS {row["peak_rss_kb"]} kB')
+            finally:
+                api.stop()
+    finally:
+        for h in hosts:
+            h.stop()
+
+    commit = git_commit()
+    out = args.output or os.path.join(ROOT, 'bench', 'results', f'{time.strftime("%Y%m%dT%H%M%S")}-{commit}.json')
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as fh:
+        json.dump({
+            'commit': commit,
+            'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': dict(behaviour, hosts=args.hosts, **probe_opts),
+            'results': results,
+        }, fh, indent=2)
+    print('Wrote', out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Local HTTP stand-ins for the TopEmbed API and channel hosts.
+
+- ApiServer serves /api.php?format=json with `days` x `events` x `channels`
+  synthetic channels spread over the channel hosts.
+- ChannelHost answers HEAD/GET for /channel/<name> with configurable latency,
+  failure rate, redirects, HEAD rejection (405) and framing headers. Each
+  channel's behaviour is derived from a hash of its name, so a given size
+  always produces the same mix.
+
+Run standalone to poke at them by hand:
+    python bench/stand_in.py --days 2 --events 5 --channels 3
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_BEHAVIOUR = {
+    'latency_ms': 20,
+    'jitter_ms': 10,
+    'failure_rate': 0.05,
+    'redirect_rate': 0.10,
+    'head_405_rate': 0.15,
+    'xfo_rate': 0.10,
+    'csp_rate': 0.05,
+}
+
+CHANNEL_BODY = b'<!doctype html><html><head><meta name="referrer" content="no-referrer"></head><body>stand-in</body></html>'
+
+
+def _fraction(name, salt):
+    """Deterministic value in [0, 1) for a channel name and a behaviour."""
+    h = hashlib.blake2b(f'{salt}:{name}'.encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(h, 'big') / 2 ** 32
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class _StandIn:
+    handler = None
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.httpd = _Server((host, port), self.handler)
+        self.httpd.stand_in = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _ChannelHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, send_body):
+        cfg = self.server.stand_in.behaviour
+        path = urlparse(self.path).path
+        name = path.rsplit('/', 1)[-1]
+        delay = cfg['latency_ms'] + cfg['jitter_ms'] * _fraction(name, 'jitter')
+        if delay:
+            time.sleep(delay / 1000.0)
+
+        if _fraction(name, 'fail') < cfg['failure_rate']:
+            return self._send(503, {}, b'unavailable', send_body)
+        if not send_body and _fraction(name, 'head') < cfg['head_405_rate']:
+            return self._send(405, {'Allow': 'GET'}, b'', send_body)
+        if path.startswith('/channel/') and _fraction(name, 'redirect') < cfg['redirect_rate']:
+            return self._send(302, {'Location': f'/landing/{name}'}, b'', send_body)
+
+        headers = {'Content-Type': 'text/html; charset=utf-8', 'ETag': f'"{name}"'}
+        if _fraction(name, 'xfo') < cfg['xfo_rate']:
+            headers['X-Frame-Options'] = 'SAMEORIGIN'
+        if _fraction(name, 'csp') < cfg['csp_rate']:
+            headers['Content-Security-Policy'] = "frame-ancestors 'self'"
+        self._send(200, headers, CHANNEL_BODY, send_body)
+
+    def _send(self, status, headers, body, send_body):
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def do_GET(self):
+        self._respond(True)
+
+
+class ChannelHost(_StandIn):
+    handler = _ChannelHandler
+
+    def __init__(self, host='127.0.0.1', port=0, **behaviour):
+        super().__init__(host, port)
+        self.behaviour = dict(DEFAULT_BEHAVIOUR, **behaviour)
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.stand_in.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_payload(days, events, channels, hosts):
+    """API payload shaped like topembed's: {'events': {day: [{..., 'channels': [...]}]}}."""
+    payload = {'events': {}}
+    n = 0
+    t0 = 1760000000
+    for d in range(days):
+        items = []
+        for e in range(events):
+            chans = []
+            for _ in range(channels):
+                host = hosts[n % len(hosts)]
+                # escaped slashes, as the real API returns them
+                chans.append(f'{host}/channel/CH{n}[BENCH]'.replace('/', '\\/'))
+                n += 1
+            items.append({
+                'unix_timestamp': t0 + d * 86400 + e * 600,
+                'sport': 'Football',
+                'tournament': f'League {e % 7}',
+                'match': f'Team {e} - Team {e + 1}',
+                'channels': chans,
+            })
+        payload['events'][f'2026-01-{d + 1:02d}'] = items
+    return payload
+
+
+class ApiServer(_StandIn):
+    handler = _ApiHandler
+
+    def __init__(self, days, events, channels, hosts, host='127.0.0.1', port=0):
+        super().__init__(host, port)
+        self.body = json.dumps(make_payload(days, events, channels, hosts)).encode('utf-8')
+
+    @property
+    def api_url(self):
+        return self.base_url + '/api.php?format=json'
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--days', type=int, default=2)
+    p.add_argument('--events', type=int, default=5)
+    p.add_argument('--channels', type=int, default=3)
+    p.add_argument('--hosts', type=int, default=2)
+    args = p.parse_args()
+    chosts = [ChannelHost().start() for _ in range(args.hosts)]
+    api = ApiServer(args.days, args.events, args.channels, [h.base_url for h in chosts]).start()
+    print('API:', api.api_url)
+    for h in chosts:
+        print('Channel host:', h.base_url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -2,17 +2,69 @@
 """Check framing-related headers for TopEmbed channel URLs.
 
 Reads out/channels.json and writes out/embed_report.json with per-channel header info.
+
+Probes run concurrently over a shared keep-alive session. Concurrency is capped
+globally (--concurrency) and per host (--per-host), and --deadline bounds the
+whole run; channels not probed in time are reported with an error.
+
+Results are cached in out/probe_cache.json (see probe_cache.py); pass --no-cache
+to probe everything from scratch. With --history (see health_history.py) each run
+is recorded and channels that keep failing are probed on a backoff schedule.
+
+Run: python check_headers.py --concurrency 16 --per-host 4 --deadline 300
 """
+import argparse
 import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from health_history import BACKOFF_WINDOW_DAYS, HealthHistory, should_probe
+from probe_cache import DEFAULT_NEGATIVE_TTL, DEFAULT_TTL, ProbeCache
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 4
+DEFAULT_TIMEOUT = 10
+# number of distinct hosts whose connection pools are kept alive at once
+POOL_HOSTS = 64
+
+
+def make_session(per_host=DEFAULT_PER_HOST):
+    """Return a requests.Session with keep-alive pools sized for per_host connections."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=max(1, per_host))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HostLimiter:
+    """Hand out one bounded semaphore per host so no host gets more than `limit` probes at once."""
 
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self._lock = threading.Lock()
+        self._sems = {}
 
-def probe_url(url, timeout=10):
-    result = {
+    def get(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            sem = self._sems.get(host)
+            if sem is None:
+                sem = self._sems[host] = threading.BoundedSemaphore(self.limit)
+        return sem
+
+
+def empty_record(url):
+    """Report record for `url` with every probed field unset."""
+    return {
         'url': url,
         'final_url': None,
         'status': None,
@@ -20,14 +72,32 @@ def probe_url(url, timeout=10):
         'x_frame_options': None,
         'csp_frame_ancestors': None,
         'referrer_meta': None,
+        'etag': None,
+        'last_modified': None,
+        'elapsed_ms': None,
+        'cached': False,
         'error': None,
     }
+
+
+def probe_url(url, timeout=DEFAULT_TIMEOUT, session=None, validators=None):
+    """Probe `url` for framing headers; `validators` adds conditional request headers."""
+    result = empty_record(url)
     headers = {'User-Agent': 'topembed-check/1.0'}
+    if validators:
+        headers.update(validators)
+    # reuse pooled connections when a session is given
+    http = session or requests
+    host = metrics.host_of(url)
+    started = time.monotonic()
     try:
         # try HEAD first
-        r = requests.head(url, headers=headers, allow_redirects=True, timeout=timeout)
+        r = http.head(url, headers=headers, allow_redirects=True, timeout=timeout)
+        record_request(host, 'HEAD', r)
         result['status'] = r.status_code
         result['final_url'] = r.url
+        result['etag'] = r.headers.get('ETag')
+        result['last_modified'] = r.headers.get('Last-Modified')
         # check headers
         xfo = r.headers.get('X-Frame-Options') or r.headers.get('x-frame-options')
         if xfo:
@@ -39,9 +109,13 @@ def probe_url(url, timeout=10):
 
         # some servers reject HEAD; if status looks not OK and server returned short, try GET
         if r.status_code >= 400 or r.status_code == 405:
-            r2 = requests.get(url, headers=headers, allow_redirects=True, timeout=timeout, stream=True)
+            metrics.REGISTRY.inc('probe_fallbacks_total', reason='status', host=host)
+            r2 = http.get(url, headers=headers, allow_redirects=True, timeout=timeout, stream=True)
+            record_request(host, 'GET', r2)
             result['status'] = r2.status_code
             result['final_url'] = r2.url
+            result['etag'] = r2.headers.get('ETag')
+            result['last_modified'] = r2.headers.get('Last-Modified')
             # check headers again
             xfo = r2.headers.get('X-Frame-Options') or r2.headers.get('x-frame-options')
             if xfo:
@@ -57,13 +131,19 @@ def probe_url(url, timeout=10):
                     result['referrer_meta'] = True
             except Exception:
                 pass
+            # release the connection back to the keep-alive pool
+            r2.close()
 
     except Exception as exc:
         # fallback to GET
+        metrics.REGISTRY.inc('probe_fallbacks_total', reason='exception', host=host)
         try:
-            r2 = requests.get(url, headers=headers, allow_redirects=True, timeout=timeout, stream=True)
+            r2 = http.get(url, headers=headers, allow_redirects=True, timeout=timeout, stream=True)
+            record_request(host, 'GET', r2)
             result['status'] = getattr(r2, 'status_code', None)
             result['final_url'] = getattr(r2, 'url', None)
+            result['etag'] = r2.headers.get('ETag')
+            result['last_modified'] = r2.headers.get('Last-Modified')
             xfo = r2.headers.get('X-Frame-Options') or r2.headers.get('x-frame-options')
             if xfo:
                 result['x_frame_options'] = xfo
@@ -77,13 +157,146 @@ def probe_url(url, timeout=10):
                     result['referrer_meta'] = True
             except Exception:
                 pass
+            r2.close()
         except Exception as exc2:
             result['error'] = str(exc2)
+            metrics.REGISTRY.inc('probe_errors_total', error=type(exc2).__name__, host=host)
 
+    elapsed = time.monotonic() - started
+    result['elapsed_ms'] = round(elapsed * 1000, 1)
+    metrics.REGISTRY.observe('probe_latency_seconds', elapsed, host=host)
     return result
 
 
-def main():
+def record_request(host, method, response):
+    metrics.REGISTRY.inc('probe_requests_total', method=method, status=response.status_code, host=host)
+    # Response.elapsed runs from sending the request until the headers are parsed
+    metrics.REGISTRY.observe('probe_ttfb_seconds', response.elapsed.total_seconds(), method=method, host=host)
+
+
+def deadline_record(url):
+    """Report record for a channel that was not probed before the run deadline.
+
+    Flagged with 'deadline' so the health history does not count it as a failure.
+    """
+    result = empty_record(url)
+    result['deadline'] = True
+    result['error'] = 'deadline exceeded'
+    return result
+
+
+def backoff_record(url, st):
+    """Report record for a channel skipped because it is in its failure backoff window."""
+    result = empty_record(url)
+    result['skipped'] = True
+    result['error'] = f"skipped: {st['consecutive_failures']} consecutive failures"
+    return result
+
+
+def history_skipper(history):
+    """Return a probe_many `skip` callable that backs off channels which keep failing."""
+    stats = history.stats(window_days=BACKOFF_WINDOW_DAYS)
+
+    def skip(url):
+        st = stats.get(url)
+        return None if should_probe(st) else backoff_record(url, st)
+    return skip
+
+
+def probe_many(urls, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+               deadline=None, timeout=DEFAULT_TIMEOUT, session=None, cache=None, skip=None,
+               sample_phases=False):
+    """Probe `urls` concurrently and return the records in input order.
+
+    `urls` may be any iterable (including a generator); probes are submitted as
+    items arrive. `deadline` is an overall budget in seconds for the whole call.
+    With a ProbeCache, fresh entries are reused and stale ones revalidated.
+    `skip(url)` may return a record to report instead of probing (see history_skipper).
+    sample_phases times DNS/connect/TLS once per host into metrics.REGISTRY.
+    """
+    own_session = session is None
+    if own_session:
+        session = make_session(per_host)
+    limiter = HostLimiter(per_host)
+    deadline_at = time.monotonic() + deadline if deadline else None
+    total = len(urls) if hasattr(urls, '__len__') else '?'
+    counter = {'done': 0}
+    counter_lock = threading.Lock()
+
+    def remaining():
+        if deadline_at is None:
+            return None
+        return deadline_at - time.monotonic()
+
+    def progress(url, label):
+        with counter_lock:
+            counter['done'] += 1
+            n = counter['done']
+        # one write per line so concurrent workers don't interleave output
+        print(f'[{n}/{total}] Probed {url} {label}\n', end='')
+
+    def task(url):
+        if skip is not None:
+            skipped = skip(url)
+            if skipped is not None:
+                metrics.REGISTRY.inc('probe_skipped_total')
+                progress(url, skipped['error'])
+                return skipped
+        conditional = None
+        if cache is not None:
+            hit = cache.fresh(url)
+            if hit is not None:
+                metrics.REGISTRY.inc('probe_cache_total', outcome='hit')
+                progress(url, 'cached')
+                return hit
+            conditional = cache.validators(url)
+        with limiter.get(url):
+            left = remaining()
+            if left is not None and left <= 0:
+                return deadline_record(url)
+            t = timeout if left is None else max(0.1, min(timeout, left))
+            if sample_phases:
+                metrics.sample_connection_phases(url, timeout=t)
+            r = probe_url(url, timeout=t, session=session, validators=conditional)
+        left = remaining()
+        if r.get('status') is None and left is not None and left <= 0:
+            # cut off by the run deadline (clipped timeout); not the channel's fault
+            r['deadline'] = True
+        if cache is not None and not r.get('deadline'):
+            metrics.REGISTRY.inc('probe_cache_total', outcome='revalidated' if r.get('status') == 304 else 'miss')
+            r = cache.update(url, r)
+        progress(url, r.get('status') or r.get('error'))
+        return r
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    futures = []
+    try:
+        for url in urls:
+            futures.append((url, executor.submit(task, url)))
+        left = remaining()
+        wait([f for _, f in futures], timeout=None if left is None else max(0, left))
+        results = []
+        for url, fut in futures:
+            if fut.done() and not fut.cancelled():
+                try:
+                    results.append(fut.result())
+                except Exception as exc:
+                    r = empty_record(url)
+                    r['error'] = str(exc)
+                    results.append(r)
+            else:
+                fut.cancel()
+                results.append(deadline_record(url))
+        return results
+    finally:
+        # don't block on stragglers past the deadline; their timeouts are already clipped
+        executor.shutdown(wait=deadline_at is None, cancel_futures=True)
+        if own_session and deadline_at is None:
+            session.close()
+
+
+def main(concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, deadline=None, timeout=DEFAULT_TIMEOUT,
+         cache_path=None, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL, history_path=None, metrics_dir=None):
     base = os.path.dirname(__file__)
     cj = os.path.join(base, 'out', 'channels.json')
     if not os.path.exists(cj):
@@ -92,17 +305,46 @@ def main():
     with open(cj, 'r', encoding='utf-8') as fh:
         data = json.load(fh)
     channels = data.get('channels', [])
-    results = []
-    for i, url in enumerate(channels):
-        print(f'[{i+1}/{len(channels)}] Probing', url)
-        r = probe_url(url)
-        results.append(r)
+    print('Probing', len(channels), 'channels, concurrency =', concurrency, 'per host =', per_host)
+    cache = ProbeCache(cache_path, ttl=ttl, negative_ttl=negative_ttl) if cache_path else None
+    history = HealthHistory(history_path) if history_path else None
+    skip = history_skipper(history) if history else None
+    t0 = time.monotonic()
+    with metrics.REGISTRY.stage('probe'):
+        results = probe_many(channels, concurrency=concurrency, per_host=per_host, deadline=deadline,
+                             timeout=timeout, cache=cache, skip=skip, sample_phases=bool(metrics_dir))
+    print(f'Probed {len(results)} channels in {time.monotonic() - t0:.1f}s')
+    metrics.REGISTRY.set('channels', len(results), stage='probe')
+    if cache is not None:
+        cache.save()
+        print('Cache:', cache.hits, 'fresh hits,', cache.revalidated, 'revalidated (304) ->', cache_path)
+    if history is not None:
+        n = history.record_probe_results(results)
+        history.close()
+        print('History: recorded', n, 'observations ->', history_path)
 
     out = os.path.join(base, 'out', 'embed_report.json')
     with open(out, 'w', encoding='utf-8') as fh:
         json.dump({'results': results}, fh, indent=2)
     print('Wrote', out)
+    if metrics_dir:
+        metrics.write_outputs(metrics_dir, 'check_headers')
 
 
 if __name__ == '__main__':
-    main()
+    p = argparse.ArgumentParser()
+    p.add_argument('--concurrency', '-c', type=int, default=DEFAULT_CONCURRENCY, help='max probes in flight overall')
+    p.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST, help='max probes in flight per host')
+    p.add_argument('--deadline', type=float, default=None, help='overall time budget in seconds')
+    p.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='per-request timeout in seconds')
+    p.add_argument('--cache', default=os.path.join(os.path.dirname(__file__), 'out', 'probe_cache.json'),
+                   help='probe cache file')
+    p.add_argument('--no-cache', action='store_true', help='probe every channel, ignoring the cache')
+    p.add_argument('--ttl', type=float, default=DEFAULT_TTL, help='seconds a successful probe stays fresh')
+    p.add_argument('--negative-ttl', type=float, default=DEFAULT_NEGATIVE_TTL, help='seconds a failed probe stays fresh')
+    p.add_argument('--history', help='health history database to record into and back off failing channels with')
+    p.add_argument('--metrics-dir', help='write check_headers.json run summary and check_headers.prom here')
+    args = p.parse_args()
+    main(concurrency=args.concurrency, per_host=args.per_host, deadline=args.deadline, timeout=args.timeout,
+         cache_path=None if args.no_cache else args.cache, ttl=args.ttl, negative_ttl=args.negative_ttl,
+         history_path=args.history, metrics_dir=args.metrics_dir)
@@ -2,8 +2,24 @@
 """Generate a lightweight static page from topembed API.
 
 Usage: python generate.py --output out --limit 120
+
+The last API response is cached (with its ETag/Last-Modified) under .cache/ and
+re-fetched with a conditional GET. The output directory records a hash of the
+channel set and page template in .build-hash; when it matches, index.html and
+channels.json are left untouched and the script exits with EXIT_UNCHANGED (3)
+so CI can skip publishing. Pass --force to rebuild anyway.
+
+--sharded writes a small shell page plus per-day JSON shards (shards/),
+manifest.json and a compact search.json; use it with --limit 0 to publish the
+full catalogue.
+
+--history orders cards by their health_history.py score, best first.
+
+--production minifies the page, moves CSS/JS into content-hashed assets/ files
+and writes .gz/.br siblings for hosts that serve precompressed files.
 """
 import argparse
+import hashlib
 import json
 import os
 import re
@@ -12,16 +28,17 @@ from urllib.parse import unquote
 
 import requests
 
+import metrics
+import static_assets
+from health_history import UNKNOWN_SCORE, HealthHistory, order_by_score
+
 API_URL = "https://topembed.pw/api.php?format=json"
+DEFAULT_API_CACHE = os.path.join('.cache', 'api.json')
+BUILD_HASH_FILE = '.build-hash'
+# exit status when the generated output would be identical to what is on disk
+EXIT_UNCHANGED = 3
 
-HTML_HEAD = """<!doctype html>
-<html lang="en">
-<head>
-<meta charset="utf-8">
-<meta name="viewport" content="width=device-width,initial-scale=1">
-<meta name="referrer" content="no-referrer">
-<title>TopEmbed — Channels</title>
-<style>
+PAGE_CSS = """
 body{font-family:Arial,Helvetica,sans-serif;margin:0;background:#111;color:#eee}
 .header{padding:18px;text-align:center;background:#0b0b0b}
 .container{display:flex;flex-wrap:wrap;padding:10px;gap:8px}
@@ -31,21 +48,17 @@ body{font-family:Arial,Helvetica,sans-serif;margin:0;background:#111;color:#eee}
 .player{position:sticky;top:0;background:#000;padding:8px}
 .player iframe{width:100%;height:480px;border:0}
 .small{font-size:12px;color:#bbb}
-</style>
-</head>
-<body>
-<div class="header"><h1 style="margin:.2em 0">TopEmbed — Channels</h1>
+"""
+
+PAGE_HEADER = """<div class="header"><h1 style="margin:.2em 0">TopEmbed — Channels</h1>
 <p class="small">Click a tile to open the stream in the player. Lazy-loads a single iframe to reduce browser load.</p>
 </div>
 <div class="player" id="player">
 <p class="small" style="color:#ccc">No channel loaded. Click a tile to play.</p>
 </div>
-<div class="container">
 """
 
-HTML_TAIL = """
-</div>
-<script>
+PLAYER_JS = """
 function loadChannel(src, label){
   const p = document.getElementById('player');
   p.innerHTML = '';
@@ -58,7 +71,176 @@ function loadChannel(src, label){
   // scroll player into view
   iframe.scrollIntoView({behavior:'smooth'});
 }
-</script>
+"""
+
+HTML_HEAD = """<!doctype html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width,initial-scale=1">
+<meta name="referrer" content="no-referrer">
+<title>TopEmbed — Channels</title>
+<style>""" + PAGE_CSS + """</style>
+</head>
+<body>
+""" + PAGE_HEADER + """<div class="container">
+"""
+
+CARD_HTML = """
+<div class="card">
+  <div class="title">{label}</div>
+  <div class="small">Source: <a href="{src}" target="_blank" rel="noopener noreferrer" style="color:#7fe0ff">Open</a></div>
+  <div style="margin-top:8px"><button onclick="loadChannel('{src}','{label}')">Play</button></div>
+</div>
+"""
+
+HTML_TAIL = """
+</div>
+<script>""" + PLAYER_JS + """</script>
+</body>
+</html>
+"""
+
+# Sharded mode: a small shell page that fetches manifest.json, then each day's
+# shard only when its section nears the viewport, rendering cards in batches.
+SHARD_CSS = """
+.day{padding:0 10px}
+.day h2{font-size:16px;margin:14px 0 4px}
+.event{font-size:13px;color:#9cf;margin:10px 0 0;width:100%}
+.sentinel{height:1px;width:100%}
+.search{padding:8px 10px}
+.search input{width:100%;padding:8px;border-radius:4px;border:1px solid #333;background:#1a1a1a;color:#eee;box-sizing:border-box}
+"""
+
+SHARD_JS = """
+const BATCH = 24;
+const MANIFEST = 'manifest.json';
+let manifest = null;
+let searchIndex = null;
+
+function el(tag, cls, text){
+  const e = document.createElement(tag);
+  if (cls) e.className = cls;
+  if (text) e.textContent = text;
+  return e;
+}
+
+function card(ch){
+  const c = el('div', 'card');
+  c.appendChild(el('div', 'title', ch[1]));
+  const s = el('div', 'small', 'Source: ');
+  const a = el('a', null, 'Open');
+  a.href = ch[0]; a.target = '_blank'; a.rel = 'noopener noreferrer'; a.style.color = '#7fe0ff';
+  s.appendChild(a);
+  c.appendChild(s);
+  const b = el('button', null, 'Play');
+  b.onclick = () => loadChannel(ch[0], ch[1]);
+  const w = el('div'); w.style.marginTop = '8px'; w.appendChild(b);
+  c.appendChild(w);
+  return c;
+}
+
+function eventTitle(ev){
+  const t = ev.time ? new Date(ev.time * 1000).toLocaleTimeString([], {hour:'2-digit', minute:'2-digit'}) + ' ' : '';
+  return t + [ev.sport, ev.tournament, ev.match].filter(Boolean).join(' · ');
+}
+
+// append cards a batch at a time whenever the section's sentinel scrolls near the viewport
+function renderProgressively(box, events){
+  const items = [];
+  events.forEach(ev => {
+    items.push({title: eventTitle(ev)});
+    ev.channels.forEach(ch => items.push({ch}));
+  });
+  let pos = 0;
+  const sentinel = el('div', 'sentinel');
+  box.appendChild(sentinel);
+  const more = new IntersectionObserver(entries => {
+    if (!entries.some(e => e.isIntersecting)) return;
+    const frag = document.createDocumentFragment();
+    for (let n = 0; pos < items.length && n < BATCH; pos++) {
+      const it = items[pos];
+      if (it.title) frag.appendChild(el('div', 'event', it.title));
+      else { frag.appendChild(card(it.ch)); n++; }
+    }
+    box.insertBefore(frag, sentinel);
+    if (pos >= items.length) { more.disconnect(); sentinel.remove(); return; }
+    // re-arm: the observer won't fire again if the sentinel is still in range
+    more.unobserve(sentinel); more.observe(sentinel);
+  }, {rootMargin: '800px'});
+  more.observe(sentinel);
+}
+
+function loadShard(day, box){
+  if (box.dataset.loaded) return;
+  box.dataset.loaded = '1';
+  fetch(day.file).then(r => r.json()).then(shard => renderProgressively(box, shard.events))
+    .catch(() => { box.dataset.loaded = ''; box.appendChild(el('p', 'small', 'Failed to load ' + day.day)); });
+}
+
+function renderDays(){
+  const root = document.getElementById('days');
+  const lazy = new IntersectionObserver(entries => {
+    entries.forEach(e => {
+      if (!e.isIntersecting) return;
+      lazy.unobserve(e.target);
+      loadShard(manifest.days[+e.target.dataset.index], e.target.querySelector('.container'));
+    });
+  }, {rootMargin: '600px'});
+  manifest.days.forEach((day, i) => {
+    const sec = el('section', 'day');
+    sec.dataset.index = i;
+    sec.appendChild(el('h2', null, day.day + ' — ' + day.events + ' events, ' + day.channels + ' channels'));
+    sec.appendChild(el('div', 'container'));
+    root.appendChild(sec);
+    lazy.observe(sec);
+  });
+}
+
+// the search index is only fetched once the user starts searching
+function search(q){
+  const out = document.getElementById('results');
+  out.innerHTML = '';
+  q = q.trim().toLowerCase();
+  if (!q) { out.style.display = 'none'; return; }
+  const run = () => {
+    let n = 0;
+    for (const row of searchIndex.rows) {
+      if (row[2].indexOf(q) < 0) continue;
+      out.appendChild(card([row[0], row[1]]));
+      if (++n >= 60) break;
+    }
+    out.style.display = '';
+  };
+  if (searchIndex) return run();
+  fetch(manifest.search).then(r => r.json()).then(idx => { searchIndex = idx; search(document.getElementById('q').value); });
+}
+
+fetch(MANIFEST).then(r => r.json()).then(m => {
+  manifest = m;
+  renderDays();
+  let timer = null;
+  document.getElementById('q').addEventListener('input', e => {
+    clearTimeout(timer);
+    timer = setTimeout(() => search(e.target.value), 150);
+  });
+});
+"""
+
+SHARDED_HTML = """<!doctype html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width,initial-scale=1">
+<meta name="referrer" content="no-referrer">
+<title>TopEmbed — Channels</title>
+<style>""" + PAGE_CSS + SHARD_CSS + """</style>
+</head>
+<body>
+""" + PAGE_HEADER + """<div class="search"><input id="q" type="search" placeholder="Search channels and events" autocomplete="off"></div>
+<div class="container" id="results" style="display:none"></div>
+<div id="days"></div>
+<script>""" + PLAYER_JS + SHARD_JS + """</script>
 </body>
 </html>
 """
@@ -82,12 +264,67 @@ def safe_channel_label(url):
     return url
 
 
-def fetch_channels(limit=200):
+def load_api_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except Exception:
+        return None
+
+
+def save_api_cache(path, etag, last_modified, data):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump({'etag': etag, 'last_modified': last_modified, 'data': data}, fh, separators=(',', ':'))
+        os.replace(tmp, path)
+    except Exception as exc:
+        print('Could not write API cache', path, exc, file=sys.stderr)
+
+
+def fetch_api(cache_path=None, sample_phases=False):
+    """Return the decoded API payload, revalidating a cached copy when one exists."""
+    with metrics.REGISTRY.stage('fetch'):
+        return _fetch_api(cache_path, sample_phases)
+
+
+def _fetch_api(cache_path, sample_phases):
+    cached = load_api_cache(cache_path) if cache_path else None
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
     print('Fetching API...', API_URL)
-    r = requests.get(API_URL, timeout=15)
+    if sample_phases:
+        metrics.sample_connection_phases(API_URL)
+    r = requests.get(API_URL, headers=headers, timeout=15)
+    metrics.REGISTRY.observe('api_ttfb_seconds', r.elapsed.total_seconds())
+    if r.status_code == 304 and cached:
+        print('API not modified, using cached response')
+        metrics.REGISTRY.inc('api_not_modified_total')
+        return cached.get('data') or {}
     r.raise_for_status()
+    metrics.REGISTRY.set('api_bytes', len(r.content))
     data = r.json()
-    channels = []
+    if cache_path:
+        save_api_cache(cache_path, r.headers.get('ETag'), r.headers.get('Last-Modified'), data)
+    return data
+
+
+def fetch_channels(limit=200, cache_path=None, sample_phases=False):
+    data = fetch_api(cache_path, sample_phases=sample_phases)
+    return extract_channels(data, limit=limit)
+
+
+def extract_channels(data, limit=200):
+    return list(iter_channels(data, limit=limit))
+
+
+def iter_channels(data, limit=200):
+    """Yield distinct channel URLs from the API payload as they are found."""
     seen = set()
     events = data.get('events', {})
     for day, items in events.items():
@@ -97,10 +334,66 @@ def fetch_channels(limit=200):
                 src = c.replace('\\/', '/')
                 if src not in seen:
                     seen.add(src)
-                    channels.append(src)
-                    if len(channels) >= limit:
-                        return channels
-    return channels
+                    yield src
+                    if limit and len(seen) >= limit:
+                        return
+
+
+def extract_events(data, limit=200):
+    """Group the API payload into days of events, keeping their metadata.
+
+    Returns [{'day', 'events': [{'time', 'sport', 'tournament', 'match', 'channels'}]}]
+    where each channel is [url, label]. `limit` caps the number of distinct
+    channels (0 = no limit), as iter_channels does; channels past it are dropped,
+    and so are events left without any.
+    """
+    days = []
+    seen = set()
+    for day, items in (data.get('events') or {}).items():
+        events = []
+        for ev in items or []:
+            if limit and len(seen) >= limit:
+                break
+            chans = []
+            in_event = set()
+            for c in ev.get('channels', []) or []:
+                src = c.replace('\\/', '/')
+                if src in in_event:
+                    continue
+                if limit and src not in seen and len(seen) >= limit:
+                    # cap reached inside this event; only channels already counted may follow
+                    continue
+                in_event.add(src)
+                seen.add(src)
+                chans.append([src, safe_channel_label(src)])
+            if not chans:
+                continue
+            events.append({
+                'time': ev.get('unix_timestamp'),
+                'sport': ev.get('sport'),
+                'tournament': ev.get('tournament'),
+                'match': ev.get('match'),
+                'channels': chans,
+            })
+        if events:
+            days.append({'day': day, 'events': events})
+    return days
+
+
+def events_from_channels(channels):
+    """Wrap a plain channel list (e.g. --input-channels) as a single sharded day."""
+    chans = [[src, safe_channel_label(src)] for src in channels]
+    if not chans:
+        return []
+    return [{'day': 'All channels', 'events': [{'time': None, 'sport': None, 'tournament': None,
+                                                'match': None, 'channels': chans}]}]
+
+
+def rank_days(days, scores):
+    """Order the channels of each sharded event by history score, best first."""
+    return [{'day': day['day'], 'events': [
+        dict(ev, channels=sorted(ev['channels'], key=lambda c: -scores.get(c[0], UNKNOWN_SCORE)))
+        for ev in day['events']]} for day in days]
 
 
 def load_channels_from_file(path, limit=200):
@@ -114,13 +407,52 @@ def load_channels_from_file(path, limit=200):
             chans = data
         else:
             chans = []
-        # preserve order, apply limit
-        return chans[:limit]
+        # preserve order, apply limit (0 = no limit)
+        return chans[:limit] if limit else chans
     except Exception:
         return []
 
 
-def build_html(channels, outpath):
+def renderer_id():
+    """Hash of this module's source, so edits to label or card rendering rebuild the output."""
+    with open(__file__, 'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def build_hash(payload, *templates):
+    """Hash of everything that determines the generated files: the renderer, templates and payload."""
+    h = hashlib.sha256()
+    h.update(renderer_id().encode('ascii'))
+    for t in templates:
+        h.update(t.encode('utf-8'))
+    h.update(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return h.hexdigest()
+
+
+def build_mode(production):
+    # production output also depends on the static_assets transform, not just the templates
+    return 'production:' + static_assets.transform_id() if production else ''
+
+
+def output_unchanged(outpath, digest):
+    stamp = os.path.join(outpath, BUILD_HASH_FILE)
+    try:
+        with open(stamp, 'r', encoding='utf-8') as fh:
+            previous = fh.read().strip()
+    except OSError:
+        return False
+    return previous == digest and os.path.exists(os.path.join(outpath, 'index.html'))
+
+
+def build_html(channels, outpath, force=False, production=False):
+    """Write index.html and channels.json; return False if the output was already current.
+
+    production=True minifies, fingerprints and precompresses the output (see static_assets).
+    """
+    digest = build_hash(channels, HTML_HEAD, CARD_HTML, HTML_TAIL, build_mode(production))
+    if not force and output_unchanged(outpath, digest):
+        print('Output unchanged (build hash', digest[:12] + '), leaving', outpath, 'untouched')
+        return False
     print('Building HTML with', len(channels), 'channels')
     parts = [HTML_HEAD]
 
@@ -128,43 +460,124 @@ def build_html(channels, outpath):
         label = safe_channel_label(src)
         # escape for HTML attributes
         escaped_src = src.replace('"', '&quot;')
-        card = f"""
-<div class="card">
-  <div class="title">{label}</div>
-  <div class="small">Source: <a href="{escaped_src}" target="_blank" rel="noopener noreferrer" style="color:#7fe0ff">Open</a></div>
-  <div style="margin-top:8px"><button onclick="loadChannel('{escaped_src}','{label}')">Play</button></div>
-</div>
-"""
-        parts.append(card)
+        parts.append(CARD_HTML.format(src=escaped_src, label=label))
 
     parts.append(HTML_TAIL)
     html = ''.join(parts)
+    files = {
+        'index.html': html,
+        # also write a machine-readable channels list for debugging/consumers
+        'channels.json': json.dumps({'channels': channels}, indent=2),
+    }
+    write_output(outpath, files, channels, production)
+    write_build_hash(outpath, digest)
+    return True
+
+
+def write_output(outpath, files, channels, production):
     os.makedirs(outpath, exist_ok=True)
-    # write HTML
-    path = os.path.join(outpath, 'index.html')
-    with open(path, 'w', encoding='utf-8') as fh:
-        fh.write(html)
-    # also write a machine-readable channels list for debugging/consumers
-    try:
-        cj = os.path.join(outpath, 'channels.json')
-        with open(cj, 'w', encoding='utf-8') as fh:
-            json.dump({'channels': channels}, fh, indent=2)
-        print('Wrote', cj)
-    except Exception:
-        pass
+    if production:
+        files = static_assets.productionize(files, static_assets.preconnect_origins(channels))
+    static_assets.write_files(outpath, files, compress=production)
+    for rel in files:
+        print('Wrote', os.path.join(outpath, rel))
+
+
+def write_build_hash(outpath, digest):
+    with open(os.path.join(outpath, BUILD_HASH_FILE), 'w', encoding='utf-8') as fh:
+        fh.write(digest + '\n')
+
+
+def compact_json(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def build_sharded(days, outpath, force=False, production=False):
+    """Write a shell index.html plus per-day JSON shards, manifest.json and search.json.
 
-    print('Wrote', path)
+    The shell page only downloads manifest.json up front; each day's shard is
+    fetched when its section scrolls near the viewport and the search index on
+    first use, so first paint does not grow with the number of channels.
+    Returns False if the output was already current.
+    """
+    digest = build_hash(days, SHARDED_HTML, build_mode(production))
+    if not force and output_unchanged(outpath, digest):
+        print('Output unchanged (build hash', digest[:12] + '), leaving', outpath, 'untouched')
+        return False
+    shard_dir = os.path.join(outpath, 'shards')
+    if os.path.isdir(shard_dir):
+        # drop shards from a previous, larger build
+        for name in os.listdir(shard_dir):
+            os.remove(os.path.join(shard_dir, name))
+
+    files = {'index.html': SHARDED_HTML}
+    manifest = {'days': [], 'search': 'search.json'}
+    rows = []
+    channels = []
+    seen = set()
+    for i, day in enumerate(days):
+        name = f'shards/day-{i:03d}.json'
+        files[name] = compact_json({'day': day['day'], 'events': day['events']})
+        n = 0
+        for ev in day['events']:
+            context = ' '.join(x for x in (ev.get('sport'), ev.get('tournament'), ev.get('match')) if x)
+            for src, label in ev['channels']:
+                n += 1
+                # [url, label, lowercase haystack, shard index]
+                rows.append([src, label, (label + ' ' + context).lower(), i])
+                if src not in seen:
+                    seen.add(src)
+                    channels.append(src)
+        manifest['days'].append({'day': day['day'], 'file': name, 'events': len(day['events']), 'channels': n})
+    files['search.json'] = compact_json({'rows': rows})
+    files['manifest.json'] = compact_json(manifest)
+    files['channels.json'] = json.dumps({'channels': channels}, indent=2)
+    print('Building sharded output with', len(days), 'shards,', len(channels), 'channels')
+    write_output(outpath, files, channels, production)
+    write_build_hash(outpath, digest)
+    return True
 
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser()
     p.add_argument('--output', '-o', default='out', help='output directory')
-    p.add_argument('--limit', '-n', type=int, default=120, help='max channels to include')
+    p.add_argument('--limit', '-n', type=int, default=120, help='max channels to include (0 = all)')
     p.add_argument('--input-channels', '-i', help='JSON file with channels list (overrides API fetch)')
+    p.add_argument('--api-cache', default=DEFAULT_API_CACHE, help='file holding the last API response and its validators')
+    p.add_argument('--no-api-cache', action='store_true', help='always download the full API response')
+    p.add_argument('--force', action='store_true', help='rewrite output even if the build hash is unchanged')
+    p.add_argument('--sharded', action='store_true',
+                   help='write a shell page with lazily loaded per-day JSON shards instead of inline cards')
+    p.add_argument('--history', help='health history database; order cards by channel score, best first')
+    p.add_argument('--production', action='store_true',
+                   help='minify, fingerprint assets and write .gz/.br siblings (see static_assets.py)')
+    p.add_argument('--metrics-dir', help='write generate.json run summary and generate.prom here')
     args = p.parse_args()
 
-    if args.input_channels:
-        chans = load_channels_from_file(args.input_channels, limit=args.limit)
+    api_cache = None if args.no_api_cache else args.api_cache
+    history = HealthHistory(args.history) if args.history else None
+    if args.sharded:
+        if args.input_channels:
+            days = events_from_channels(load_channels_from_file(args.input_channels, limit=args.limit))
+        else:
+            days = extract_events(fetch_api(api_cache, sample_phases=bool(args.metrics_dir)), limit=args.limit)
+        if history:
+            days = rank_days(days, history.scores([c[0] for d in days for e in d['events'] for c in e['channels']]))
+        with metrics.REGISTRY.stage('build'):
+            written = build_sharded(days, args.output, force=args.force, production=args.production)
+        metrics.REGISTRY.set('channels', sum(len(e['channels']) for d in days for e in d['events']), stage='build')
     else:
-        chans = fetch_channels(limit=args.limit)
-    build_html(chans, args.output)
+        if args.input_channels:
+            chans = load_channels_from_file(args.input_channels, limit=args.limit)
+        else:
+            chans = fetch_channels(limit=args.limit, cache_path=api_cache, sample_phases=bool(args.metrics_dir))
+        if history:
+            chans = order_by_score(chans, history.scores(chans))
+        with metrics.REGISTRY.stage('build'):
+            written = build_html(chans, args.output, force=args.force, production=args.production)
+        metrics.REGISTRY.set('channels', len(chans), stage='build')
+    metrics.REGISTRY.set('build_unchanged', 0 if written else 1)
+    if args.metrics_dir:
+        metrics.write_outputs(args.metrics_dir, 'generate')
+    if not written:
+        sys.exit(EXIT_UNCHANGED)
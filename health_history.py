@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Channel health history in a local SQLite database.
+
+Every probe, extractor and HLS run can append one observation per channel
+(ok/failed, HTTP status, latency). Over a sliding window the store answers
+per-channel uptime, consecutive failures and latency percentiles, and turns
+them into a 0-100 score used to:
+
+- prune channels below --min-score (prune_channels.py / pipeline.py --history)
+- order cards so the fastest, most reliable channels come first (generate.py --history)
+- back off probing channels that keep failing (check_headers.py --history)
+
+Run:
+    python health_history.py record-extractor embed/channels.resolved.json
+    python health_history.py record-hls out/hls_report.json
+    python health_history.py stats --window-days 14
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import time
+
+DEFAULT_DB = os.path.join('.cache', 'health_history.sqlite3')
+DEFAULT_WINDOW_DAYS = 14
+# score given to channels with no observations in the window
+UNKNOWN_SCORE = 50.0
+DEFAULT_MIN_SCORE = 40.0
+# after this many consecutive failures a channel is only re-probed on a backoff schedule
+BACKOFF_AFTER = 3
+BACKOFF_BASE = 6 * 3600
+BACKOFF_MAX = 7 * 86400
+# backoff looks further back than scoring so weekly re-probes still see the whole failure streak
+BACKOFF_WINDOW_DAYS = 60
+# sources whose latency is a network round trip; extractor timings (browser time to
+# resolution, seconds) are reported separately and do not feed the score
+LATENCY_SOURCES = ('probe', 'hls')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    url TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    status INTEGER,
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS observations_url_ts ON observations (url, ts);
+CREATE INDEX IF NOT EXISTS observations_ts ON observations (ts);
+"""
+
+
+class HealthHistory:
+    """Append-only store of channel observations with windowed stats."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def record(self, rows, source, now=None):
+        """Append (url, ok, status, latency_ms) rows observed in one run."""
+        now = int(time.time() if now is None else now)
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO observations (url, ts, source, ok, status, latency_ms) VALUES (?, ?, ?, ?, ?, ?)',
+                [(url, now, source, 1 if ok else 0, status, latency) for url, ok, status, latency in rows])
+
+    def record_probe_results(self, results, now=None):
+        """Record check_headers records; cache hits, skipped channels and probes cut off by the
+        run deadline are not new observations.
+
+        Health is reachability (HTTP 200); framing headers are judged separately when pruning.
+        """
+        rows = [(r['url'], r.get('status') == 200, r.get('status'), r.get('elapsed_ms'))
+                for r in results if not (r.get('cached') or r.get('skipped') or r.get('deadline'))]
+        self.record(rows, 'probe', now)
+        return len(rows)
+
+    def record_extractor_results(self, channels, now=None):
+        """Record channels.resolved.json entries: ok when at least one stream was found."""
+        rows = []
+        for ch in channels:
+            page = ch.get('page') or ch.get('url')
+            if page:
+                rows.append((page, bool(ch.get('streams')), None, ch.get('elapsed_ms')))
+        self.record(rows, 'extractor', now)
+        return len(rows)
+
+    def record_hls_results(self, results, now=None):
+        """Record hls_check.py results per page: ok when any of its streams played."""
+        pages = {}
+        for r in results:
+            page = r.get('page') or r.get('url')
+            ok, latency = pages.get(page, (False, None))
+            if r.get('ok'):
+                ok = True
+                ttfb = r.get('playlist_ttfb_ms')
+                # the fastest playable stream stands for the page
+                if ttfb is not None and (latency is None or ttfb < latency):
+                    latency = ttfb
+            pages[page] = (ok, latency)
+        self.record([(page, ok, None, latency) for page, (ok, latency) in pages.items()], 'hls', now)
+        return len(pages)
+
+    def stats(self, urls=None, window_days=DEFAULT_WINDOW_DAYS, now=None):
+        """Return {url: stats} over the last `window_days` (see channel_stats for the fields)."""
+        now = time.time() if now is None else now
+        since = int(now - window_days * 86400)
+        query = 'SELECT url, ts, ok, latency_ms, source FROM observations WHERE ts >= ?'
+        params = [since]
+        if urls is not None:
+            urls = list(urls)
+            if not urls:
+                return {}
+            # a temp table keeps the IN list bounded regardless of channel count
+            self.db.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (url TEXT PRIMARY KEY)')
+            self.db.execute('DELETE FROM wanted')
+            self.db.executemany('INSERT OR IGNORE INTO wanted (url) VALUES (?)', [(u,) for u in urls])
+            query += ' AND url IN (SELECT url FROM wanted)'
+        query += ' ORDER BY url, ts DESC'
+        grouped = {}
+        for url, ts, ok, latency, source in self.db.execute(query, params):
+            grouped.setdefault(url, []).append((ts, ok, latency, source))
+        return {url: channel_stats(rows) for url, rows in grouped.items()}
+
+    def scores(self, urls=None, window_days=DEFAULT_WINDOW_DAYS, now=None, known_only=False):
+        """Return {url: score}; urls without history get UNKNOWN_SCORE, or are left out with known_only."""
+        st = self.stats(urls, window_days=window_days, now=now)
+        out = {url: score(s) for url, s in st.items()}
+        if not known_only:
+            for url in urls or ():
+                out.setdefault(url, UNKNOWN_SCORE)
+        return out
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def channel_stats(rows):
+    """Stats for one channel from (ts, ok, latency_ms, source) rows, newest first.
+
+    p50/p95 cover LATENCY_SOURCES only; extractor_p50_ms is the browser's time to resolution.
+    """
+    oks = [row[1] for row in rows]
+    consecutive = 0
+    for ok in oks:
+        if ok:
+            break
+        consecutive += 1
+    latencies = [lat for _, ok, lat, src in rows if ok and lat is not None and src in LATENCY_SOURCES]
+    extractor = [lat for _, ok, lat, src in rows if ok and lat is not None and src == 'extractor']
+    last_ok = next((row[0] for row in rows if row[1]), None)
+    return {
+        'samples': len(rows),
+        'uptime': sum(oks) / len(oks) if oks else None,
+        'consecutive_failures': consecutive,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'extractor_p50_ms': percentile(extractor, 50),
+        'last_checked': rows[0][0] if rows else None,
+        'last_ok': last_ok,
+    }
+
+
+def score(st):
+    """0-100: uptime, discounted by median latency and by a current failure streak."""
+    if not st or not st.get('samples'):
+        return UNKNOWN_SCORE
+    value = 100.0 * (st['uptime'] or 0.0)
+    if st.get('p50_ms') is not None:
+        # 1 s median latency costs a third of the score, 2 s half
+        value *= 1.0 / (1.0 + st['p50_ms'] / 2000.0)
+    value -= 10.0 * st.get('consecutive_failures', 0)
+    return round(max(0.0, min(100.0, value)), 2)
+
+
+def should_probe(st, now=None):
+    """False while a failing channel is inside its exponential backoff interval."""
+    if not st or st.get('consecutive_failures', 0) < BACKOFF_AFTER:
+        return True
+    now = time.time() if now is None else now
+    interval = min(BACKOFF_BASE * math.pow(2, st['consecutive_failures'] - BACKOFF_AFTER), BACKOFF_MAX)
+    return now - (st.get('last_checked') or 0) >= interval
+
+
+def order_by_score(urls, scores):
+    """Sort urls by score, best first; ties keep their input order."""
+    return sorted(urls, key=lambda u: -scores.get(u, UNKNOWN_SCORE))
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--db', default=DEFAULT_DB, help='history database')
+    sub = p.add_subparsers(dest='cmd', required=True)
+    for name in ('record-probe', 'record-extractor', 'record-hls'):
+        sub.add_parser(name).add_argument('path')
+    st = sub.add_parser('stats')
+    st.add_argument('--window-days', type=float, default=DEFAULT_WINDOW_DAYS)
+    st.add_argument('--limit', type=int, default=50, help='rows to print (worst first)')
+    args = p.parse_args()
+
+    history = HealthHistory(args.db)
+    try:
+        if args.cmd == 'stats':
+            stats = history.stats(window_days=args.window_days)
+            rows = sorted(stats.items(), key=lambda kv: score(kv[1]))
+            print(f'{"score":>6} {"uptime":>7} {"fails":>5} {"p50ms":>8} {"p95ms":>8}  url')
+            for url, s in rows[:args.limit]:
+                p50 = f'{s["p50_ms"]:.0f}' if s['p50_ms'] is not None else '-'
+                p95 = f'{s["p95_ms"]:.0f}' if s['p95_ms'] is not None else '-'
+                print(f'{score(s):6.1f} {s["uptime"]:7.1%} {s["consecutive_failures"]:5d} {p50:>8} {p95:>8}  {url}')
+            print(len(stats), 'channels with history')
+            return
+        with open(args.path, 'r', encoding='utf-8') as fh:
+            data = json.load(fh)
+        if args.cmd == 'record-probe':
+            n = history.record_probe_results(data.get('results', []))
+        elif args.cmd == 'record-extractor':
+            n = history.record_extractor_results(data.get('channels', []))
+        else:
+            n = history.record_hls_results(data.get('results', []))
+        print('Recorded', n, 'observations in', args.db)
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    main()
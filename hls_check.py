@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Check that resolved HLS streams actually play.
+
+Reads embed/channels.resolved.json ({'channels': [{'page', 'streams'}]}) or a
+plain channel list such as embed/channels.json, and for every .m3u8 URL:
+
+- fetches the playlist and, for a master playlist, picks one variant
+- fetches the media playlist and does a ranged GET of its first segment
+- for live playlists, re-fetches the media playlist after one target duration
+  to see whether the media sequence advances
+
+Writes out/hls_report.json with time-to-first-byte, segment throughput,
+advertised vs observed bitrate and freshness per stream. prune_channels.py
+--hls-report drops channels whose streams all failed.
+
+Run: python hls_check.py --input embed/channels.resolved.json --concurrency 8
+"""
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from check_headers import DEFAULT_PER_HOST, HostLimiter, make_session
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 10
+# bytes of the first segment to download when measuring throughput
+DEFAULT_RANGE_BYTES = 256 * 1024
+# longest we wait for a live playlist to advance
+DEFAULT_MAX_FRESHNESS_WAIT = 12
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36'
+
+ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(line):
+    return {k: v.strip('"') for k, v in ATTR_RE.findall(line.split(':', 1)[1] if ':' in line else '')}
+
+
+def parse_master(text, base_url):
+    """Return [{'bandwidth', 'resolution', 'uri'}] for each #EXT-X-STREAM-INF variant."""
+    variants = []
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF'):
+            attrs = parse_attributes(line)
+            try:
+                bw = int(attrs.get('AVERAGE-BANDWIDTH') or attrs.get('BANDWIDTH') or 0)
+            except ValueError:
+                bw = 0
+            pending = {'bandwidth': bw, 'resolution': attrs.get('RESOLUTION')}
+        elif pending is not None and line and not line.startswith('#'):
+            pending['uri'] = urljoin(base_url, line)
+            variants.append(pending)
+            pending = None
+    return variants
+
+
+def parse_media(text, base_url):
+    """Return target duration, media sequence, segments [(duration, uri)] and whether the list has ended."""
+    info = {'target_duration': None, 'media_sequence': 0, 'segments': [], 'endlist': False}
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-TARGETDURATION:'):
+            try:
+                info['target_duration'] = float(line.split(':', 1)[1])
+            except ValueError:
+                pass
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            try:
+                info['media_sequence'] = int(line.split(':', 1)[1])
+            except ValueError:
+                pass
+        elif line.startswith('#EXTINF:'):
+            try:
+                duration = float(line.split(':', 1)[1].split(',', 1)[0])
+            except ValueError:
+                duration = None
+        elif line.startswith('#EXT-X-ENDLIST'):
+            info['endlist'] = True
+        elif line and not line.startswith('#'):
+            info['segments'].append((duration, urljoin(base_url, line)))
+            duration = None
+    return info
+
+
+def fetch_text(session, url, timeout):
+    """GET a playlist; return (response, text, ttfb_ms)."""
+    t = time.monotonic()
+    r = session.get(url, headers={'User-Agent': USER_AGENT}, timeout=timeout, stream=True)
+    ttfb = (time.monotonic() - t) * 1000
+    try:
+        text = r.content.decode('utf-8', errors='ignore')
+    finally:
+        r.close()
+    return r, text, ttfb
+
+
+def fetch_segment(session, url, timeout, range_bytes):
+    """Ranged GET of a segment; return status, ttfb_ms, bytes read, seconds spent reading and full size if known."""
+    headers = {'User-Agent': USER_AGENT, 'Range': f'bytes=0-{range_bytes - 1}'}
+    t = time.monotonic()
+    r = session.get(url, headers=headers, timeout=timeout, stream=True)
+    ttfb = (time.monotonic() - t) * 1000
+    got = 0
+    try:
+        for chunk in r.iter_content(chunk_size=16384):
+            got += len(chunk)
+            if got >= range_bytes:
+                break
+    finally:
+        r.close()
+    elapsed = time.monotonic() - t
+    size = None
+    content_range = r.headers.get('Content-Range') or ''
+    if '/' in content_range and not content_range.endswith('*'):
+        size = int(content_range.rsplit('/', 1)[1])
+    elif r.status_code == 200 and r.headers.get('Content-Length'):
+        size = int(r.headers['Content-Length'])
+    return r.status_code, ttfb, got, elapsed, size
+
+
+def check_stream(url, page=None, session=None, timeout=DEFAULT_TIMEOUT, range_bytes=DEFAULT_RANGE_BYTES,
+                 variant='lowest', max_wait=DEFAULT_MAX_FRESHNESS_WAIT):
+    result = {
+        'url': url,
+        'page': page or url,
+        'ok': False,
+        'status': None,
+        'variants': 0,
+        'media_playlist': None,
+        'advertised_bitrate': None,
+        'observed_bitrate': None,
+        'playlist_ttfb_ms': None,
+        'segment_status': None,
+        'segment_ttfb_ms': None,
+        'segment_bytes': None,
+        'throughput_bps': None,
+        'realtime_ratio': None,
+        'live': None,
+        'media_sequence': None,
+        'sequence_advanced': None,
+        'checked_at': int(time.time()),
+        'error': None,
+    }
+    session = session or make_session()
+    try:
+        r, text, ttfb = fetch_text(session, url, timeout)
+        result['status'] = r.status_code
+        result['playlist_ttfb_ms'] = round(ttfb, 1)
+        if r.status_code >= 400:
+            result['error'] = f'playlist HTTP {r.status_code}'
+            return result
+        if '#EXTM3U' not in text[:1024]:
+            result['error'] = 'not an HLS playlist'
+            return result
+
+        media_url, media_text = r.url, text
+        if '#EXT-X-STREAM-INF' in text:
+            variants = parse_master(text, r.url)
+            result['variants'] = len(variants)
+            if not variants:
+                result['error'] = 'master playlist without variants'
+                return result
+            variants.sort(key=lambda v: v['bandwidth'])
+            chosen = variants[-1] if variant == 'highest' else variants[0]
+            result['advertised_bitrate'] = chosen['bandwidth'] or None
+            mr, media_text, _ = fetch_text(session, chosen['uri'], timeout)
+            if mr.status_code >= 400:
+                result['error'] = f'media playlist HTTP {mr.status_code}'
+                return result
+            media_url = mr.url
+        result['media_playlist'] = media_url
+
+        media = parse_media(media_text, media_url)
+        result['live'] = not media['endlist']
+        result['media_sequence'] = media['media_sequence']
+        if not media['segments']:
+            result['error'] = 'media playlist without segments'
+            return result
+
+        seg_duration, seg_url = media['segments'][0]
+        status, seg_ttfb, got, elapsed, size = fetch_segment(session, seg_url, timeout, range_bytes)
+        result['segment_status'] = status
+        result['segment_ttfb_ms'] = round(seg_ttfb, 1)
+        result['segment_bytes'] = got
+        if status >= 400 or not got:
+            result['error'] = f'segment HTTP {status}'
+            return result
+        if elapsed > 0:
+            result['throughput_bps'] = int(got * 8 / elapsed)
+        if size and seg_duration:
+            result['observed_bitrate'] = int(size * 8 / seg_duration)
+        bitrate = result['observed_bitrate'] or result['advertised_bitrate']
+        if bitrate and result['throughput_bps']:
+            # < 1 means the segment downloads slower than it plays
+            result['realtime_ratio'] = round(result['throughput_bps'] / bitrate, 2)
+
+        if result['live'] and max_wait > 0:
+            time.sleep(min(media['target_duration'] or max_wait, max_wait))
+            ar, again, _ = fetch_text(session, media_url, timeout)
+            if ar.status_code >= 400:
+                result['error'] = f'playlist refresh HTTP {ar.status_code}'
+                return result
+            if '#EXTM3U' not in again[:1024]:
+                result['error'] = 'playlist refresh is not an HLS playlist'
+                return result
+            result['sequence_advanced'] = parse_media(again, media_url)['media_sequence'] > media['media_sequence']
+
+        result['ok'] = result['sequence_advanced'] is not False
+        if not result['ok']:
+            result['error'] = 'live playlist is not advancing'
+    except Exception as exc:
+        result['error'] = str(exc)
+    return result
+
+
+def load_streams(path):
+    """Return [(stream_url, page)] from a resolved or plain channels file."""
+    with open(path, 'r', encoding='utf-8') as fh:
+        data = json.load(fh)
+    chans = data.get('channels', []) if isinstance(data, dict) else data
+    streams = []
+    for ch in chans:
+        if isinstance(ch, str):
+            streams.append((ch, ch))
+        elif isinstance(ch, dict):
+            page = ch.get('page') or ch.get('url')
+            for s in ch.get('streams') or []:
+                if re.search(r'\.m3u8(\?|$)', s, re.I):
+                    streams.append((s, page))
+    return streams
+
+
+def check_many(streams, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, **kwargs):
+    """Check [(url, page)] concurrently; return results in input order."""
+    session = make_session(per_host)
+    limiter = HostLimiter(per_host)
+    total = len(streams)
+
+    def task(i, url, page):
+        with limiter.get(url):
+            r = check_stream(url, page=page, session=session, **kwargs)
+        print(f'[{i + 1}/{total}] {"OK  " if r["ok"] else "FAIL"} {url} {r["error"] or ""}'.rstrip())
+        return r
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        futures = [ex.submit(task, i, url, page) for i, (url, page) in enumerate(streams)]
+        return [f.result() for f in futures]
+
+
+def main():
+    base = os.path.dirname(__file__)
+    p = argparse.ArgumentParser()
+    p.add_argument('--input', default=None, help='resolved channels JSON (default embed/channels.resolved.json, '
+                                                 'falling back to embed/channels.json)')
+    p.add_argument('--output', default=os.path.join(base, 'out', 'hls_report.json'))
+    p.add_argument('--concurrency', '-c', type=int, default=DEFAULT_CONCURRENCY)
+    p.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST)
+    p.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    p.add_argument('--range-bytes', type=int, default=DEFAULT_RANGE_BYTES, help='bytes of the first segment to fetch')
+    p.add_argument('--variant', choices=['lowest', 'highest'], default='lowest', help='which variant to check')
+    p.add_argument('--max-wait', type=float, default=DEFAULT_MAX_FRESHNESS_WAIT,
+                   help='max seconds to wait for a live playlist to advance (0 = skip freshness check)')
+    args = p.parse_args()
+
+    path = args.input
+    if not path:
+        path = os.path.join(base, 'embed', 'channels.resolved.json')
+        if not os.path.exists(path):
+            path = os.path.join(base, 'embed', 'channels.json')
+    streams = load_streams(path)
+    print('Checking', len(streams), 'streams from', path)
+    results = check_many(streams, concurrency=args.concurrency, per_host=args.per_host, timeout=args.timeout,
+                         range_bytes=args.range_bytes, variant=args.variant, max_wait=args.max_wait)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as fh:
+        json.dump({'results': results}, fh, indent=2)
+    print('Wrote', args.output, '(', sum(1 for r in results if r['ok']), 'of', len(results), 'streams OK )')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Run metrics for the generator, probe and prune scripts.
+
+A process-wide REGISTRY collects counters, gauges and histograms (with
+optional labels) plus stage durations. write_outputs() exports them as a JSON
+run summary and a Prometheus textfile for node_exporter's textfile collector.
+
+requests does not expose per-phase timings, so time-to-first-byte is taken
+from Response.elapsed per request, while DNS, TCP connect and TLS handshake
+are sampled once per host with sample_connection_phases() (pooled requests
+reuse that connection setup anyway).
+"""
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+PREFIX = 'topembed_'
+# seconds; covers local stand-ins up to slow relays near the request timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# raw samples kept per histogram series for percentiles in the JSON summary
+MAX_SAMPLES = 10000
+
+HELP = {
+    'api_ttfb_seconds': 'Time to response headers for the TopEmbed API',
+    'api_bytes': 'Size of the API response body',
+    'api_not_modified_total': 'API fetches answered 304 Not Modified',
+    'probe_requests_total': 'HTTP requests sent by the framing probe',
+    'probe_fallbacks_total': 'HEAD probes that fell back to GET',
+    'probe_errors_total': 'Probes that ended in an exception',
+    'probe_latency_seconds': 'Total probe time per channel',
+    'probe_ttfb_seconds': 'Time to response headers per probe request',
+    'probe_cache_total': 'Probe cache outcomes',
+    'probe_skipped_total': 'Channels skipped by history backoff',
+    'connect_dns_seconds': 'DNS resolution time, sampled once per host',
+    'connect_tcp_seconds': 'TCP connect time, sampled once per host',
+    'connect_tls_seconds': 'TLS handshake time, sampled once per host',
+    'resolve_total': 'Channel pages by HTTP resolver outcome',
+    'resolve_latency_seconds': 'Time to resolve one channel page over HTTP',
+    'stage_duration_seconds': 'Wall time per pipeline stage',
+    'channels': 'Channel counts by stage',
+    'build_unchanged': '1 if the generator left its output untouched',
+}
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = []
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+
+    def percentile(self, pct):
+        if not self.samples:
+            return None
+        values = sorted(self.samples)
+        return values[min(len(values) - 1, int(round((len(values) - 1) * pct / 100.0)))]
+
+
+class Registry:
+    """Thread-safe store of counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.started = time.time()
+            self._phase_hosts = set()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            k = _key(labels)
+            series[k] = series.get(k, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            k = _key(labels)
+            if k not in series:
+                series[k] = Histogram()
+            series[k].observe(value)
+
+    @contextmanager
+    def stage(self, name):
+        t = time.monotonic()
+        try:
+            yield
+        finally:
+            self.set('stage_duration_seconds', time.monotonic() - t, stage=name)
+
+    def claim_host(self, host):
+        """True the first time `host` is seen, so phases are sampled once per host."""
+        with self._lock:
+            if host in self._phase_hosts:
+                return False
+            self._phase_hosts.add(host)
+            return True
+
+    def summary(self, job):
+        with self._lock:
+            def series(d, fn):
+                return {name: [dict(labels=dict(k), **fn(v)) for k, v in s.items()] for name, s in d.items()}
+            return {
+                'job': job,
+                'started': int(self.started),
+                'duration_seconds': round(time.time() - self.started, 3),
+                'counters': series(self.counters, lambda v: {'value': v}),
+                'gauges': series(self.gauges, lambda v: {'value': round(v, 6) if isinstance(v, float) else v}),
+                'histograms': series(self.histograms, lambda h: {
+                    'count': h.count,
+                    'sum': round(h.sum, 6),
+                    'p50': h.percentile(50),
+                    'p95': h.percentile(95),
+                    'p99': h.percentile(99),
+                }),
+            }
+
+    def prometheus(self, job):
+        lines = []
+
+        def labels_text(k, extra=()):
+            # not 'job': node_exporter's scrape owns that label and would rename ours to exported_job
+            items = [('script', job)] + list(k) + list(extra)
+            return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in items) + '}'
+
+        def head(name, kind):
+            full = PREFIX + name
+            if name in HELP:
+                lines.append(f'# HELP {full} {HELP[name]}')
+            lines.append(f'# TYPE {full} {kind}')
+            return full
+
+        with self._lock:
+            for name, s in sorted(self.counters.items()):
+                full = head(name, 'counter')
+                for k, v in s.items():
+                    lines.append(f'{full}{labels_text(k)} {v}')
+            for name, s in sorted(self.gauges.items()):
+                full = head(name, 'gauge')
+                for k, v in s.items():
+                    lines.append(f'{full}{labels_text(k)} {v}')
+            for name, s in sorted(self.histograms.items()):
+                full = head(name, 'histogram')
+                for k, h in s.items():
+                    for bound, count in zip(h.buckets, h.counts):
+                        lines.append(f'{full}_bucket{labels_text(k, [("le", repr(bound))])} {count}')
+                    lines.append(f'{full}_bucket{labels_text(k, [("le", "+Inf")])} {h.count}')
+                    lines.append(f'{full}_sum{labels_text(k)} {h.sum}')
+                    lines.append(f'{full}_count{labels_text(k)} {h.count}')
+            full = head('last_run_timestamp_seconds', 'gauge')
+            lines.append(f'{full}{labels_text(())} {int(time.time())}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+REGISTRY = Registry()
+
+
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+
+def sample_connection_phases(url, timeout=5, registry=REGISTRY):
+    """Time DNS, TCP connect and (for https) TLS handshake to the host of `url`, once per host."""
+    parsed = urlparse(url)
+    host = parsed.hostname
+    if not host or not registry.claim_host(parsed.netloc.lower()):
+        return
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    labels = {'host': parsed.netloc.lower()}
+    try:
+        t = time.monotonic()
+        family, kind, proto, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        registry.observe('connect_dns_seconds', time.monotonic() - t, **labels)
+        sock = socket.socket(family, kind, proto)
+        sock.settimeout(timeout)
+        try:
+            t = time.monotonic()
+            sock.connect(addr)
+            registry.observe('connect_tcp_seconds', time.monotonic() - t, **labels)
+            if parsed.scheme == 'https':
+                t = time.monotonic()
+                tls = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+                registry.observe('connect_tls_seconds', time.monotonic() - t, **labels)
+                tls.close()
+        finally:
+            sock.close()
+    except Exception as exc:
+        registry.inc('connect_sample_errors_total', error=type(exc).__name__, **labels)
+
+
+def write_outputs(directory, job, registry=REGISTRY):
+    """Write <job>.json (run summary) and <job>.prom (Prometheus textfile) into `directory`."""
+    os.makedirs(directory, exist_ok=True)
+    outputs = {
+        os.path.join(directory, f'{job}.json'): json.dumps(registry.summary(job), indent=2),
+        os.path.join(directory, f'{job}.prom'): registry.prometheus(job),
+    }
+    for path, text in outputs.items():
+        # the textfile collector may read at any moment; never expose a partial file
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+        print('Wrote', path)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Run fetch -> probe -> prune -> build in one process.
+
+Replaces the generate.py / check_headers.py / prune_channels.py /
+generate.py --input-channels chain: records are passed in memory, channels are
+submitted to the probe pool as soon as they are read from the API payload, and
+the intermediate JSON files are only written when --debug-dir is given. Wall
+time for each stage is printed at the end (and saved to timings.json in the
+debug directory). With --metrics-dir the same timings plus probe counters and
+latency histograms are written as pipeline.json / pipeline.prom (see metrics.py).
+
+Run: python pipeline.py --output out --limit 200 --debug-dir out/debug
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import check_headers
+import generate
+import metrics
+import prune_channels
+from health_history import DEFAULT_MIN_SCORE, DEFAULT_WINDOW_DAYS, HealthHistory, order_by_score
+from probe_cache import DEFAULT_NEGATIVE_TTL, DEFAULT_TTL, ProbeCache
+
+
+class StageTimer:
+    """Collect wall-clock durations for named pipeline stages."""
+
+    def __init__(self):
+        self.stages = []
+        self._t0 = time.monotonic()
+
+    @contextmanager
+    def stage(self, name):
+        t = time.monotonic()
+        try:
+            yield
+        finally:
+            secs = time.monotonic() - t
+            self.stages.append((name, secs))
+            metrics.REGISTRY.set('stage_duration_seconds', secs, stage=name)
+
+    def total(self):
+        return time.monotonic() - self._t0
+
+    def report(self):
+        print('Stage timings:')
+        for name, secs in self.stages:
+            print(f'  {name:<8} {secs:8.2f}s')
+        print(f'  {"total":<8} {self.total():8.2f}s')
+
+    def as_dict(self):
+        return {'stages': {name: round(secs, 4) for name, secs in self.stages}, 'total': round(self.total(), 4)}
+
+
+def write_debug(debug_dir, name, obj):
+    if not debug_dir:
+        return
+    os.makedirs(debug_dir, exist_ok=True)
+    path = os.path.join(debug_dir, name)
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(obj, fh, indent=2)
+    print('Wrote', path)
+
+
+def keep_channels(days, keep):
+    """Drop channels not in `keep` from sharded days, and events/days left empty."""
+    out = []
+    for day in days:
+        events = []
+        for ev in day['events']:
+            chans = [c for c in ev['channels'] if c[0] in keep]
+            if chans:
+                events.append(dict(ev, channels=chans))
+        if events:
+            out.append({'day': day['day'], 'events': events})
+    return out
+
+
+def run(args):
+    timer = StageTimer()
+    data = None
+    with timer.stage('fetch'):
+        if args.input_channels:
+            source = generate.load_channels_from_file(args.input_channels, limit=args.limit)
+        else:
+            data = generate.fetch_api(None if args.no_api_cache else args.api_cache,
+                                      sample_phases=bool(args.metrics_dir))
+            source = generate.iter_channels(data, limit=args.limit)
+
+    channels = []
+
+    def feed():
+        # hand channels to the probe pool one by one while remembering the order
+        for src in source:
+            channels.append(src)
+            yield src
+
+    cache = None if args.no_cache else ProbeCache(args.cache, ttl=args.ttl, negative_ttl=args.negative_ttl)
+    history = HealthHistory(args.history) if args.history else None
+    skip = check_headers.history_skipper(history) if history else None
+    with timer.stage('probe'):
+        results = check_headers.probe_many(feed(), concurrency=args.concurrency, per_host=args.per_host,
+                                           deadline=args.deadline, timeout=args.timeout, cache=cache, skip=skip,
+                                           sample_phases=bool(args.metrics_dir))
+        if cache is not None:
+            cache.save()
+    write_debug(args.debug_dir, 'channels.json', {'channels': channels})
+    write_debug(args.debug_dir, 'embed_report.json', {'results': results})
+
+    with timer.stage('prune'):
+        scores = None
+        if history is not None:
+            history.record_probe_results(results)
+            scores = history.scores(channels, window_days=args.window_days, known_only=True)
+            good = order_by_score(prune_channels.prune_by_score(results, scores, args.min_score), scores)
+        else:
+            good = prune_channels.prune(results)
+    print('Pruned to', len(good), 'of', len(channels), 'channels')
+    metrics.REGISTRY.set('channels', len(channels), stage='probe')
+    metrics.REGISTRY.set('channels', len(good), stage='kept')
+    write_debug(args.debug_dir, 'pruned_channels.json', {'channels': good})
+
+    with timer.stage('build'):
+        if args.sharded:
+            if data is None:
+                days = generate.events_from_channels(good)
+            else:
+                days = keep_channels(generate.extract_events(data, limit=args.limit), set(good))
+                if scores is not None:
+                    days = generate.rank_days(days, scores)
+            written = generate.build_sharded(days, args.output, force=args.force, production=args.production)
+        else:
+            written = generate.build_html(good, args.output, force=args.force, production=args.production)
+
+    if history is not None:
+        history.close()
+    timer.report()
+    write_debug(args.debug_dir, 'timings.json', timer.as_dict())
+    metrics.REGISTRY.set('build_unchanged', 0 if written else 1)
+    if args.metrics_dir:
+        metrics.write_outputs(args.metrics_dir, 'pipeline')
+    return written
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--output', '-o', default='out', help='output directory')
+    p.add_argument('--limit', '-n', type=int, default=120, help='max channels to include (0 = all)')
+    p.add_argument('--input-channels', '-i', help='JSON file with channels list (overrides API fetch)')
+    p.add_argument('--api-cache', default=generate.DEFAULT_API_CACHE, help='file holding the last API response')
+    p.add_argument('--no-api-cache', action='store_true', help='always download the full API response')
+    p.add_argument('--sharded', action='store_true', help='write sharded output (see generate.py --sharded)')
+    p.add_argument('--force', action='store_true', help='rewrite output even if the build hash is unchanged')
+    p.add_argument('--production', action='store_true', help='minify, fingerprint and precompress the output')
+    p.add_argument('--concurrency', '-c', type=int, default=check_headers.DEFAULT_CONCURRENCY,
+                   help='max probes in flight overall')
+    p.add_argument('--per-host', type=int, default=check_headers.DEFAULT_PER_HOST, help='max probes in flight per host')
+    p.add_argument('--deadline', type=float, default=None, help='overall probe time budget in seconds')
+    p.add_argument('--timeout', type=float, default=check_headers.DEFAULT_TIMEOUT, help='per-request timeout in seconds')
+    p.add_argument('--cache', default=os.path.join('out', 'probe_cache.json'), help='probe cache file')
+    p.add_argument('--no-cache', action='store_true', help='probe every channel, ignoring the cache')
+    p.add_argument('--ttl', type=float, default=DEFAULT_TTL, help='seconds a successful probe stays fresh')
+    p.add_argument('--negative-ttl', type=float, default=DEFAULT_NEGATIVE_TTL, help='seconds a failed probe stays fresh')
+    p.add_argument('--history', help='health history database: record probes, back off dead channels, '
+                                     'prune on score and order cards best first')
+    p.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE, help='minimum history score (0-100) to keep')
+    p.add_argument('--window-days', type=float, default=DEFAULT_WINDOW_DAYS, help='history window for scoring')
+    p.add_argument('--debug-dir', help='also write channels.json, embed_report.json, pruned_channels.json here')
+    p.add_argument('--metrics-dir', help='write pipeline.json run summary and pipeline.prom (Prometheus textfile) here')
+    args = p.parse_args()
+
+    if not run(args):
+        sys.exit(generate.EXIT_UNCHANGED)
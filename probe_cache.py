@@ -0,0 +1,101 @@
+"""Persistent on-disk cache of check_headers.py probe results.
+
+Entries are keyed by channel URL and hold the last report record plus the
+ETag/Last-Modified validators and the time it was probed. Fresh entries are
+reused without touching the network; stale entries are revalidated with
+If-None-Match/If-Modified-Since. Failed probes get a shorter (negative) TTL so
+dead channels are retried sooner than healthy ones are re-checked.
+"""
+import json
+import os
+import threading
+import time
+
+DEFAULT_TTL = 12 * 3600
+DEFAULT_NEGATIVE_TTL = 30 * 60
+CACHE_VERSION = 1
+
+
+def is_failure(record):
+    status = record.get('status') or 0
+    return bool(record.get('error')) or status == 0 or status >= 400
+
+
+class ProbeCache:
+    """Thread-safe URL -> probe record cache backed by a JSON file."""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+            if data.get('version') == CACHE_VERSION:
+                self._entries = data.get('entries', {})
+        except Exception:
+            self._entries = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with self._lock:
+            data = {'version': CACHE_VERSION, 'entries': self._entries}
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                json.dump(data, fh, separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+    def fresh(self, url, now=None):
+        """Return a copy of the cached record for `url` if it is still within its TTL."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(url)
+            if not entry:
+                return None
+            ttl = self.negative_ttl if is_failure(entry['record']) else self.ttl
+            if now - entry.get('checked_at', 0) >= ttl:
+                return None
+            self.hits += 1
+            return dict(entry['record'], cached=True)
+
+    def validators(self, url):
+        """Conditional request headers for revalidating a stale entry."""
+        with self._lock:
+            entry = self._entries.get(url)
+        headers = {}
+        if entry and not is_failure(entry['record']):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update(self, url, record, now=None):
+        """Store a fresh probe result and return the record to report.
+
+        A 304 answer keeps the cached record and only refreshes its timestamp.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(url)
+            if record.get('status') == 304 and entry:
+                self.revalidated += 1
+                entry['checked_at'] = now
+                entry['etag'] = record.get('etag') or entry.get('etag')
+                entry['last_modified'] = record.get('last_modified') or entry.get('last_modified')
+                # the revalidation round trip is this run's latency
+                return dict(entry['record'], elapsed_ms=record.get('elapsed_ms'))
+            self._entries[url] = {
+                'record': dict(record),
+                'etag': record.get('etag'),
+                'last_modified': record.get('last_modified'),
+                'checked_at': now,
+            }
+        return record
@@ -7,35 +7,124 @@ Criteria (default):
 - no CSP frame-ancestors directive
 - is_https == True
 
-Run: python prune_channels.py
+With --hls-report out/hls_report.json (from hls_check.py), channels whose
+checked streams all failed are dropped too; --min-realtime-ratio also treats
+streams that download slower than they play as failed.
+
+With --history (see health_history.py) the single-snapshot status check is
+replaced by a score over the channel's recent history: channels scoring below
+--min-score are dropped, the framing/https checks still apply.
+
+Run: python prune_channels.py [--hls-report out/hls_report.json] [--history .cache/health_history.sqlite3]
 """
+import argparse
 import json
 import os
 import sys
 
+import metrics
+from health_history import DEFAULT_MIN_SCORE, DEFAULT_WINDOW_DAYS, HealthHistory
+
+
+def frameable(r):
+    xfo = r.get('x_frame_options')
+    csp = r.get('csp_frame_ancestors')
+    https = r.get('is_https', False)
+    return not xfo and not csp and https
+
+
+def is_embeddable(r):
+    status = r.get('status') or 0
+    return status == 200 and frameable(r)
+
+
+def prune(results):
+    """Return the URLs of the report records that pass the criteria, in report order."""
+    return [r.get('url') for r in results if is_embeddable(r)]
+
+
+def prune_by_score(results, scores, min_score=DEFAULT_MIN_SCORE):
+    """Like prune(), but a history score >= min_score stands in for the HTTP 200 check.
 
-def main():
+    `scores` holds only urls with observations in the window; the rest, and any
+    record whose probe failed outright this run, fall back to is_embeddable().
+    """
+    good = []
+    for r in results:
+        url = r.get('url')
+        if url in scores and r.get('status') is not None and not r.get('error'):
+            keep = frameable(r) and scores[url] >= min_score
+        else:
+            keep = is_embeddable(r)
+        if keep:
+            good.append(url)
+    return good
+
+
+def stream_healthy(r, min_realtime_ratio=None):
+    if not r.get('ok'):
+        return False
+    ratio = r.get('realtime_ratio')
+    if min_realtime_ratio and ratio is not None and ratio < min_realtime_ratio:
+        return False
+    return True
+
+
+def dead_pages(hls_results, min_realtime_ratio=None):
+    """Pages (channel URLs) for which every checked stream failed."""
+    healthy = {}
+    for r in hls_results:
+        page = r.get('page') or r.get('url')
+        healthy[page] = healthy.get(page, False) or stream_healthy(r, min_realtime_ratio)
+    return {page for page, ok in healthy.items() if not ok}
+
+
+def main(hls_report=None, min_realtime_ratio=None, report=None, out=None, history=None,
+         min_score=DEFAULT_MIN_SCORE, window_days=DEFAULT_WINDOW_DAYS, metrics_dir=None):
     base = os.path.dirname(__file__)
-    report = os.path.join(base, 'out', 'embed_report.json')
+    report = report or os.path.join(base, 'out', 'embed_report.json')
     if not os.path.exists(report):
         print('Missing report:', report)
         sys.exit(2)
     with open(report, 'r', encoding='utf-8') as fh:
         data = json.load(fh)
-    good = []
-    for r in data.get('results', []):
-        status = r.get('status') or 0
-        xfo = r.get('x_frame_options')
-        csp = r.get('csp_frame_ancestors')
-        https = r.get('is_https', False)
-        if status == 200 and not xfo and not csp and https:
-            good.append(r.get('url'))
-
-    out = os.path.join(base, 'out', 'pruned_channels.json')
+    results = data.get('results', [])
+    with metrics.REGISTRY.stage('prune'):
+        if history:
+            store = HealthHistory(history)
+            scores = store.scores([r.get('url') for r in results], window_days=window_days, known_only=True)
+            store.close()
+            good = prune_by_score(results, scores, min_score)
+        else:
+            good = prune(results)
+        if hls_report:
+            with open(hls_report, 'r', encoding='utf-8') as fh:
+                dead = dead_pages(json.load(fh).get('results', []), min_realtime_ratio)
+            before = len(good)
+            good = [u for u in good if u not in dead]
+            print('Dropped', before - len(good), 'channels with no playable stream')
+    metrics.REGISTRY.set('channels', len(results), stage='prune_input')
+    metrics.REGISTRY.set('channels', len(good), stage='kept')
+
+    out = out or os.path.join(base, 'out', 'pruned_channels.json')
     with open(out, 'w', encoding='utf-8') as fh:
         json.dump({'channels': good}, fh, indent=2)
     print('Wrote', out, '(', len(good), 'channels )')
+    if metrics_dir:
+        metrics.write_outputs(metrics_dir, 'prune_channels')
 
 
 if __name__ == '__main__':
-    main()
+    p = argparse.ArgumentParser()
+    p.add_argument('--hls-report', help='hls_check.py report; drop channels whose streams all failed')
+    p.add_argument('--min-realtime-ratio', type=float, default=None,
+                   help='treat streams whose segment throughput / bitrate is below this as failed')
+    p.add_argument('--report', help='embed report to read (default out/embed_report.json)')
+    p.add_argument('--output', help='file to write (default out/pruned_channels.json)')
+    p.add_argument('--history', help='health history database; prune on score instead of the last status')
+    p.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE, help='minimum history score (0-100) to keep')
+    p.add_argument('--window-days', type=float, default=DEFAULT_WINDOW_DAYS, help='history window for scoring')
+    p.add_argument('--metrics-dir', help='write prune_channels.json run summary and prune_channels.prom here')
+    args = p.parse_args()
+    main(hls_report=args.hls_report, min_realtime_ratio=args.min_realtime_ratio, report=args.report, out=args.output,
+         history=args.history, min_score=args.min_score, window_days=args.window_days, metrics_dir=args.metrics_dir)
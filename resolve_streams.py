@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""Resolve channel pages to HLS stream URLs with plain HTTP, before Puppeteer.
+
+Reads embed/channels.json (the extractor's input) and, for every channel page:
+
+- fetches the page over a shared keep-alive session (concurrency capped
+  globally and per host, like check_headers.py)
+- scans the HTML and inline scripts for .m3u8 / playlist / manifest URLs,
+  after undoing common obfuscations: escaped slashes (\\/, \\x2f, \\u002f),
+  HTML entities, percent-encoded URLs, '...' + '...' concatenation and
+  base64 strings passed to atob()
+- if nothing is found, follows the first few <iframe src> one level down,
+  sending the page as Referer
+- checks that a candidate really is a playlist (#EXTM3U) before accepting it
+
+Writes embed/channels.resolved.json in the extractor's schema
+({'generated_at', 'channels': [{'page', 'streams'}]}, one entry per input
+channel, unresolved ones with no streams) and embed/channels.unresolved.json
+with only the pages the browser still has to render. After the browser run,
+--merge folds its results back in:
+
+    python resolve_streams.py
+    node scripts/extractor.js --input embed/channels.unresolved.json --output embed/channels.browser.json
+    python resolve_streams.py --merge embed/channels.browser.json
+"""
+import argparse
+import base64
+import binascii
+import html
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import unquote, urljoin, urlparse
+
+import metrics
+from check_headers import DEFAULT_PER_HOST, HostLimiter, make_session
+from hls_check import USER_AGENT
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 10
+# bytes of a page (or iframe) read before giving up on it
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+# iframes followed per page when the page itself has no playlist URL
+MAX_IFRAMES = 3
+# candidates checked per page before giving up
+MAX_CANDIDATES = 5
+
+M3U8_RE = re.compile(r'https?://[^"\'<>\s\\]+?\.m3u8(?:\?[^"\'<>\s\\]*)?', re.I)
+# same fallback as the extractor when no .m3u8 URL is present
+PLAYLIST_RE = re.compile(r'https?://[^"\'<>\s\\]+/(?:playlist|manifest)[^"\'<>\s\\]*', re.I)
+RELATIVE_M3U8_RE = re.compile(r'["\']([^"\'<>\s:]+\.m3u8(?:\?[^"\'<>\s]*)?)["\']', re.I)
+IFRAME_RE = re.compile(r'<iframe\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)["\']', re.I)
+ATOB_RE = re.compile(r'atob\(\s*["\']([A-Za-z0-9+/=_-]{8,})["\']\s*\)')
+# base64 of "http" starts with aHR0c; catches encoded URLs decoded by helpers other than atob
+B64_URL_RE = re.compile(r'["\'](aHR0c[A-Za-z0-9+/=_-]{10,})["\']')
+CONCAT_RE = re.compile(r'["\']\s*\+\s*["\']')
+ESCAPES = (
+    (re.compile(r'\\/'), '/'),
+    (re.compile(r'\\x2f', re.I), '/'),
+    (re.compile(r'\\u002f', re.I), '/'),
+    (re.compile(r'\\x3a', re.I), ':'),
+    (re.compile(r'\\u003a', re.I), ':'),
+    (re.compile(r'\\u0026', re.I), '&'),
+)
+PLAYLIST_TYPES = ('mpegurl', 'vnd.apple.mpegurl')
+
+
+def unescape(text):
+    for pattern, repl in ESCAPES:
+        text = pattern.sub(repl, text)
+    text = html.unescape(text)
+    # percent-encoded URLs, e.g. ?src=https%3A%2F%2Fhost%2Flive.m3u8
+    text = re.sub(r'https?%3A%2F%2F[^"\'<>\s&]+', lambda m: unquote(m.group(0)), text, flags=re.I)
+    return CONCAT_RE.sub('', text)
+
+
+def decode_base64(blob):
+    blob = blob.replace('-', '+').replace('_', '/')
+    try:
+        return base64.b64decode(blob + '=' * (-len(blob) % 4)).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def texts_to_scan(text):
+    """The unescaped page text plus any base64 payloads found in it, unescaped too."""
+    text = unescape(text)
+    out = [text]
+    for blob in ATOB_RE.findall(text) + B64_URL_RE.findall(text):
+        decoded = decode_base64(blob)
+        if decoded:
+            out.append(unescape(decoded))
+    return out
+
+
+def find_streams(text, base_url):
+    """Candidate playlist URLs in `text`, in order of appearance, .m3u8 URLs first."""
+    found = []
+    fallback = []
+    for chunk in texts_to_scan(text):
+        found.extend(M3U8_RE.findall(chunk))
+        found.extend(urljoin(base_url, rel) for rel in RELATIVE_M3U8_RE.findall(chunk))
+        fallback.extend(PLAYLIST_RE.findall(chunk))
+    return list(dict.fromkeys(found or fallback))
+
+
+def find_iframes(text, base_url):
+    srcs = []
+    for src in IFRAME_RE.findall(unescape(text)):
+        url = urljoin(base_url, src.strip())
+        if urlparse(url).scheme in ('http', 'https'):
+            srcs.append(url)
+    return list(dict.fromkeys(srcs))[:MAX_IFRAMES]
+
+
+def fetch(session, url, timeout, referer=None, max_bytes=MAX_PAGE_BYTES):
+    """GET up to max_bytes of `url`; return (response, text)."""
+    headers = {'User-Agent': USER_AGENT}
+    if referer:
+        headers['Referer'] = referer
+    r = session.get(url, headers=headers, timeout=timeout, stream=True)
+    try:
+        body = bytearray()
+        for chunk in r.iter_content(chunk_size=65536):
+            body += chunk
+            if len(body) >= max_bytes:
+                break
+    finally:
+        r.close()
+    return r, bytes(body).decode(r.encoding or 'utf-8', errors='ignore')
+
+
+def is_playlist(response, text):
+    ctype = (response.headers.get('Content-Type') or '').lower()
+    return response.status_code == 200 and (any(t in ctype for t in PLAYLIST_TYPES) or text.lstrip().startswith('#EXTM3U'))
+
+
+def verified(session, candidates, timeout, referer, verify=True):
+    """Candidates that answer with an HLS playlist (all of them when verify is off)."""
+    if not verify:
+        return candidates[:MAX_CANDIDATES]
+    good = []
+    for url in candidates[:MAX_CANDIDATES]:
+        try:
+            r, text = fetch(session, url, timeout, referer=referer, max_bytes=4096)
+        except Exception:
+            continue
+        if is_playlist(r, text):
+            good.append(url)
+    return good
+
+
+def resolve_page(url, session, timeout=DEFAULT_TIMEOUT, follow_iframes=True, verify=True):
+    """Return {'page', 'streams', 'elapsed_ms'}, plus 'error' when the page could not be fetched."""
+    t = time.monotonic()
+    record = {'page': url, 'streams': [], 'elapsed_ms': None}
+    try:
+        r, text = fetch(session, url, timeout)
+        if is_playlist(r, text):
+            # the channel entry already is a playlist
+            record['streams'] = [url]
+        else:
+            streams = verified(session, find_streams(text, r.url), timeout, r.url, verify)
+            if not streams and follow_iframes:
+                for src in find_iframes(text, r.url):
+                    try:
+                        fr, ftext = fetch(session, src, timeout, referer=r.url)
+                    except Exception:
+                        continue
+                    if is_playlist(fr, ftext):
+                        streams = [src]
+                    else:
+                        streams = verified(session, find_streams(ftext, fr.url), timeout, fr.url, verify)
+                    if streams:
+                        break
+            record['streams'] = streams
+    except Exception as exc:
+        record['error'] = str(exc)
+    record['elapsed_ms'] = round((time.monotonic() - t) * 1000, 1)
+    return record
+
+
+def resolve_many(pages, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, **kwargs):
+    """Resolve pages concurrently; return records in input order."""
+    session = make_session(per_host)
+    limiter = HostLimiter(per_host)
+    total = len(pages)
+
+    def task(i, url):
+        with limiter.get(url):
+            r = resolve_page(url, session=session, **kwargs)
+        outcome = 'error' if r.get('error') else 'resolved' if r['streams'] else 'unresolved'
+        metrics.REGISTRY.inc('resolve_total', outcome=outcome)
+        metrics.REGISTRY.observe('resolve_latency_seconds', r['elapsed_ms'] / 1000.0, host=metrics.host_of(url))
+        print(f'[{i + 1}/{total}] {len(r["streams"])} streams {url} {r.get("error") or ""}'.rstrip() + '\n', end='')
+        return r
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        futures = [ex.submit(task, i, url) for i, url in enumerate(pages)]
+        return [f.result() for f in futures]
+
+
+def load_pages(path):
+    """Channel page URLs from an extractor input file ({'channels': [...]} or a bare list)."""
+    with open(path, 'r', encoding='utf-8') as fh:
+        data = json.load(fh)
+    chans = data.get('channels', []) if isinstance(data, dict) else data
+    pages = []
+    for ch in chans:
+        if isinstance(ch, dict):
+            ch = ch.get('url') or ch.get('page') or ch.get('link') or ch.get('channel')
+        if isinstance(ch, str) and ch:
+            pages.append(ch)
+    return pages
+
+
+def merge(records, browser_records):
+    """Fill channels the HTTP tier left empty with what the browser found, keeping input order."""
+    found = {r.get('page'): r for r in browser_records if r.get('streams')}
+    return [found.get(r['page'], r) if not r.get('streams') else r for r in records]
+
+
+def generated_at():
+    # same format as the extractor's new Date().toISOString()
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def write_json(path, obj):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(obj, fh, indent=2)
+    print('Wrote', path)
+
+
+def main():
+    base = os.path.dirname(__file__)
+    p = argparse.ArgumentParser()
+    p.add_argument('--input', default=os.path.join(base, 'embed', 'channels.json'), help='extractor input channels')
+    p.add_argument('--output', default=os.path.join(base, 'embed', 'channels.resolved.json'))
+    p.add_argument('--unresolved', default=os.path.join(base, 'embed', 'channels.unresolved.json'),
+                   help='channels left for the browser extractor')
+    p.add_argument('--merge', metavar='BROWSER_JSON',
+                   help='merge browser extractor output into --output instead of resolving')
+    p.add_argument('--concurrency', '-c', type=int, default=DEFAULT_CONCURRENCY)
+    p.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST)
+    p.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    p.add_argument('--no-iframes', action='store_true', help='do not follow iframes on pages without a stream URL')
+    p.add_argument('--no-verify', action='store_true', help='accept candidate URLs without fetching them')
+    p.add_argument('--metrics-dir', help='write resolve_streams.json run summary and resolve_streams.prom here')
+    args = p.parse_args()
+
+    if args.merge:
+        with open(args.output, 'r', encoding='utf-8') as fh:
+            records = json.load(fh).get('channels', [])
+        with open(args.merge, 'r', encoding='utf-8') as fh:
+            browser = json.load(fh).get('channels', [])
+        records = merge(records, browser)
+        write_json(args.output, {'generated_at': generated_at(), 'channels': records})
+        print(sum(1 for r in records if r.get('streams')), 'of', len(records), 'channels resolved after merge')
+        return
+
+    pages = load_pages(args.input)
+    print('Resolving', len(pages), 'channels from', args.input)
+    with metrics.REGISTRY.stage('resolve'):
+        records = resolve_many(pages, concurrency=args.concurrency, per_host=args.per_host, timeout=args.timeout,
+                               follow_iframes=not args.no_iframes, verify=not args.no_verify)
+    unresolved = [r['page'] for r in records if not r['streams']]
+    write_json(args.output, {'generated_at': generated_at(), 'channels': records})
+    write_json(args.unresolved, {'channels': unresolved})
+    print(len(pages) - len(unresolved), 'of', len(pages), 'channels resolved over HTTP;',
+          len(unresolved), 'left for the browser')
+    if args.metrics_dir:
+        metrics.write_outputs(args.metrics_dir, 'resolve_streams')
+
+
+if __name__ == '__main__':
+    main()
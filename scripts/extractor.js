@@ -5,10 +5,16 @@ const fs = require('fs');
 const path = require('path');
 const puppeteer = require('puppeteer');
 const argv = require('minimist')(process.argv.slice(2));
+const lean = require('./lean');
 
 const inputPath = argv.input || 'embed/channels.json';
 const outputPath = argv.output || 'embed/channels.resolved.json';
 const concurrency = Math.max(1, parseInt(argv.concurrency || argv.c || '4', 10));
+// --lean: block non-essential requests, resolve on the first playlist, pool pages (see lean.js)
+const leanMode = Boolean(argv.lean);
+const recycleAfter = lean.intArg(argv, 'recycle-after', lean.DEFAULTS.recycleAfter);
+const settleMs = lean.intArg(argv, 'settle-ms', lean.DEFAULTS.settleMs);
+const timeoutMs = lean.intArg(argv, 'timeout-ms', lean.DEFAULTS.timeoutMs);
 
 const USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36';
 
@@ -155,17 +161,18 @@ async function extract() {
     }
   }
 
-  console.log('Channels to process:', Array.isArray(channels) ? channels.length : 0, 'concurrency =', concurrency);
+  console.log('Channels to process:', Array.isArray(channels) ? channels.length : 0, 'concurrency =', concurrency, leanMode ? '(lean)' : '');
   // ensure debug folder exists and write an initial run header
   writeDebug(`\n=== run at ${new Date().toISOString()} ===`);
-  writeDebug(`Channels to process: ${Array.isArray(channels) ? channels.length : 0} concurrency=${concurrency}`);
+  writeDebug(`Channels to process: ${Array.isArray(channels) ? channels.length : 0} concurrency=${concurrency} lean=${leanMode}`);
 
   // Puppeteer launch with retries and CI-friendly flags
   async function launchBrowserWithRetries(retries = 3) {
     let lastErr = null;
     for (let i = 0; i < retries; i++) {
       try {
-        const launchOpts = { args: ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage'], timeout: 120000 };
+        const args = ['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage'].concat(leanMode ? lean.LEAN_ARGS : []);
+        const launchOpts = { args, timeout: 120000 };
         // allow overriding executable path via env (for CI that caches Chrome)
         if (process.env.PUPPETEER_EXECUTABLE_PATH) launchOpts.executablePath = process.env.PUPPETEER_EXECUTABLE_PATH;
         const b = await puppeteer.launch(launchOpts);
@@ -182,6 +189,20 @@ async function extract() {
     throw lastErr;
   }
 
+  function logResult(res) {
+    console.log(' Found', res.streams.length, 'for', res.page, res.elapsed_ms != null ? `(${res.elapsed_ms} ms)` : '');
+    writeDebug(`[CHANNEL] ${res.page} found=${res.streams.length} elapsed_ms=${res.elapsed_ms}${res.error ? ' error=' + res.error : ''}`);
+    if (res.streams && res.streams.length) writeDebug(`[CHANNEL STREAMS] ${res.page} ${res.streams.join(' | ')}`);
+  }
+
+  if (leanMode) {
+    const results = await lean.extractLean(Array.isArray(channels) ? channels : [], () => launchBrowserWithRetries(3), {
+      concurrency, recycleAfter, settleMs, timeoutMs, userAgent: USER_AGENT, onResult: logResult,
+    });
+    writeOutput(results);
+    return;
+  }
+
   const browser = await launchBrowserWithRetries(3);
   const results = [];
 
@@ -211,6 +232,10 @@ async function extract() {
     try { await browser.close(); } catch (e) { /* ignore */ }
   }
 
+  writeOutput(results);
+}
+
+function writeOutput(results) {
   const out = { generated_at: new Date().toISOString(), channels: results };
   fs.mkdirSync(path.dirname(outputPath), { recursive: true });
   fs.writeFileSync(outputPath, JSON.stringify(out, null, 2));
@@ -3,11 +3,14 @@ const fs = require('fs');
 const path = require('path');
 const puppeteer = require('puppeteer');
 const argv = require('minimist')(process.argv.slice(2));
+const lean = require('./lean');
 
 const inputPath = argv.input || 'embed/channels.json';
 const outputPath = argv.output || 'embed/channels.resolved.json';
 const concurrency = Math.max(1, parseInt(argv.concurrency || argv.c || 4, 10));
-console.log('Using concurrency =', concurrency);
+// --lean: block non-essential requests, resolve on the first playlist, pool pages (see lean.js)
+const leanMode = Boolean(argv.lean);
+console.log('Using concurrency =', concurrency, leanMode ? '(lean)' : '');
 
 async function extract() {
   if (!fs.existsSync(inputPath)) {
@@ -24,6 +27,19 @@ async function extract() {
     process.exit(1);
   }
 
+  if (leanMode) {
+    const launch = () => puppeteer.launch({args: ['--no-sandbox','--disable-setuid-sandbox'].concat(lean.LEAN_ARGS)});
+    const results = await lean.extractLean(channels, launch, {
+      concurrency,
+      recycleAfter: lean.intArg(argv, 'recycle-after', lean.DEFAULTS.recycleAfter),
+      settleMs: lean.intArg(argv, 'settle-ms', lean.DEFAULTS.settleMs),
+      timeoutMs: lean.intArg(argv, 'timeout-ms', lean.DEFAULTS.timeoutMs),
+      onResult: (res) => console.log(' Found', res.streams.length, 'streams for', res.page, `(${res.elapsed_ms} ms)`),
+    });
+    writeOutput(results);
+    return;
+  }
+
   const browser = await puppeteer.launch({args: ['--no-sandbox','--disable-setuid-sandbox']});
   const results = [];
 
@@ -90,6 +106,10 @@ async function extract() {
     try { await browser.close(); } catch(e){}
   }
 
+  writeOutput(results);
+}
+
+function writeOutput(results) {
   const out = {generated_at: new Date().toISOString(), channels: results};
   fs.mkdirSync(path.dirname(outputPath), {recursive: true});
   fs.writeFileSync(outputPath, JSON.stringify(out, null, 2));
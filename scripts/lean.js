@@ -0,0 +1,242 @@
+// Lean extraction mode shared by extractor.js and extractor_parallel.js (--lean).
+//
+// - images, fonts, stylesheets and media plus known ad/analytics hosts are
+//   blocked at the request-interception layer
+// - a channel resolves as soon as its first playlist response arrives; the
+//   page is only waited on (briefly) when nothing has shown up yet
+// - .mp4 requests are recorded (as the default mode does) before the media
+//   block applies, but do not end the wait since prerolls are often mp4
+// - each worker keeps one incognito context and page and reuses it across
+//   channels instead of opening a page per channel
+// - the browser is replaced after --recycle-after channels to cap memory
+// - every result records elapsed_ms (time to resolution)
+
+const BLOCKED_TYPES = new Set(['image', 'font', 'stylesheet', 'media', 'texttrack', 'ping', 'cspviolationreport', 'manifest']);
+const BLOCKED_HOSTS = [
+  'doubleclick.net', 'googlesyndication.com', 'googleadservices.com', 'google-analytics.com',
+  'googletagmanager.com', 'googletagservices.com', 'adservice.google.com', 'amazon-adsystem.com',
+  'facebook.net', 'scorecardresearch.com', 'quantserve.com', 'hotjar.com', 'cloudflareinsights.com',
+  'mc.yandex.ru', 'histats.com', 'statcounter.com', 'taboola.com', 'outbrain.com', 'popads.net',
+  'popcash.net', 'propellerads.com', 'adsterra.com', 'exoclick.com', 'juicyads.com', 'onclickads.net',
+];
+// extra Chromium flags for lean runs; appended to the caller's launch args
+const LEAN_ARGS = ['--mute-audio', '--disable-extensions', '--disable-background-networking', '--no-first-run',
+  '--blink-settings=imagesEnabled=false'];
+
+const DEFAULTS = {
+  concurrency: 4,
+  recycleAfter: 50,
+  timeoutMs: 30000,
+  // how long to wait for a playlist after DOMContentLoaded before giving up
+  settleMs: 8000,
+  userAgent: 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36',
+};
+
+const PLAYLIST_URL = /\.m3u8(\?|$)/i;
+const MP4_URL = /\.mp4(\?|$)/i;
+const PLAYLIST_TYPE = /mpegurl|application\/vnd\.apple\.mpegurl|vnd\.apple\.mpegurl/i;
+
+function channelUrl(ch) {
+  return typeof ch === 'string' ? ch : ch.url || ch.page || ch.link || ch.channel || ch;
+}
+
+function isBlockedHost(url) {
+  let host;
+  try { host = new URL(url).hostname; } catch (e) { return false; }
+  return BLOCKED_HOSTS.some(h => host === h || host.endsWith('.' + h));
+}
+
+// integer CLI option (minimist argv) that may legitimately be 0
+function intArg(argv, name, fallback) {
+  return argv[name] != null ? parseInt(argv[name], 10) : fallback;
+}
+
+function sleep(ms) {
+  return new Promise(r => setTimeout(r, ms));
+}
+
+// Hands out the current browser and replaces it after `recycleAfter` channels.
+// Every acquire() is a lease for one channel, taken before any await and
+// returned with release(); a retired browser is closed when its last lease is.
+class BrowserPool {
+  constructor(launch, recycleAfter) {
+    this.launch = launch;
+    this.recycleAfter = recycleAfter;
+    this.current = null;
+  }
+
+  async acquire() {
+    const cur = this.current;
+    if (cur && ((this.recycleAfter > 0 && cur.served >= this.recycleAfter) || (cur.browser && !cur.browser.isConnected()))) {
+      const old = this.current;
+      this.current = null;
+      if (old.users === 0) await this.closeEntry(old);
+    }
+    if (!this.current) {
+      const entry = { browser: null, served: 0, users: 0 };
+      entry.ready = this.launch().then(b => { entry.browser = b; return b; });
+      this.current = entry;
+    }
+    const entry = this.current;
+    entry.served++;
+    entry.users++;
+    try {
+      await entry.ready;
+    } catch (err) {
+      entry.users--;
+      // let the next channel try a fresh launch
+      if (this.current === entry) this.current = null;
+      throw err;
+    }
+    return entry;
+  }
+
+  async release(entry) {
+    entry.users--;
+    if (entry !== this.current && entry.users === 0) await this.closeEntry(entry);
+  }
+
+  async closeEntry(entry) {
+    try { await (await entry.ready).close(); } catch (e) { /* ignore */ }
+  }
+
+  async close() {
+    if (this.current) await this.closeEntry(this.current);
+    this.current = null;
+  }
+}
+
+// One incognito context + page, reused for many channels. Listeners are
+// attached once and report into whichever channel is currently loading.
+async function openSlot(browser, opts) {
+  const context = await browser.createIncognitoBrowserContext();
+  const page = await context.newPage();
+  const slot = { context, page, current: null };
+  page.setDefaultNavigationTimeout(opts.timeoutMs);
+  await page.setUserAgent(opts.userAgent);
+  await page.setRequestInterception(true);
+
+  const hit = (url, final = true) => {
+    if (!slot.current) return;
+    slot.current.found.add(url);
+    if (final) {
+      slot.current.final = true;
+      slot.current.done();
+    }
+  };
+
+  page.on('request', (req) => {
+    try {
+      const url = req.url();
+      if (PLAYLIST_URL.test(url)) {
+        // a native <video> load of the playlist counts as found too
+        if (req.resourceType() === 'media') hit(url);
+        req.continue().catch(() => {});
+      } else if (MP4_URL.test(url) && !isBlockedHost(url)) {
+        // keep the URL, skip the download
+        hit(url, false);
+        req.abort('blockedbyclient').catch(() => {});
+      } else if (BLOCKED_TYPES.has(req.resourceType()) || isBlockedHost(url)) {
+        req.abort('blockedbyclient').catch(() => {});
+      } else {
+        req.continue().catch(() => {});
+      }
+    } catch (e) { /* ignore */ }
+  });
+
+  page.on('response', (res) => {
+    try {
+      const url = res.url();
+      const ct = (res.headers() || {})['content-type'] || '';
+      if (res.status() < 400 && (PLAYLIST_URL.test(url) || PLAYLIST_TYPE.test(ct))) hit(url);
+    } catch (e) { /* ignore */ }
+  });
+
+  slot.close = async () => {
+    try { await context.close(); } catch (e) { /* ignore */ }
+  };
+  return slot;
+}
+
+async function resolveChannel(slot, url, opts) {
+  const t0 = Date.now();
+  const found = new Set();
+  let done;
+  const resolved = new Promise(r => { done = r; });
+  const state = { found, done, final: false };
+  slot.current = state;
+  let error = null;
+  try {
+    const nav = slot.page.goto(url, { waitUntil: 'domcontentloaded', timeout: opts.timeoutMs })
+      .catch((e) => { error = e && e.message ? e.message : String(e); });
+    await Promise.race([resolved, nav]);
+    // a failed navigation will not produce a playlist later; skip the settle wait
+    if (!state.final && !error) await Promise.race([resolved, sleep(opts.settleMs)]);
+    if (!state.final) {
+      // last resort, once per channel: playlist URLs written into the DOM
+      try {
+        const text = await slot.page.content();
+        const m = text.match(/https?:\/\/[^"'<>\s]+\.m3u8/gi) || text.match(/https?:\/\/[^"'<>\s]+(\/playlist|\/manifest)[^"'<>\s]*/gi) || [];
+        m.forEach(u => found.add(u));
+      } catch (e) { /* ignore */ }
+    }
+  } finally {
+    slot.current = null;
+    // stop whatever the channel is still loading before the page is reused
+    await slot.page.goto('about:blank').catch(() => {});
+  }
+  const res = { page: url, streams: Array.from(found), elapsed_ms: Date.now() - t0 };
+  if (!found.size && error) res.error = error;
+  return res;
+}
+
+// Resolve `channels` with `concurrency` pooled pages; `launch` returns a new browser.
+// onResult(res) is called as each channel finishes. Results keep input order.
+async function extractLean(channels, launch, options = {}) {
+  const opts = Object.assign({}, DEFAULTS, options);
+  const pool = new BrowserPool(launch, opts.recycleAfter);
+  const results = new Array(channels.length);
+  let next = 0;
+
+  const workers = new Array(Math.min(opts.concurrency, channels.length)).fill(0).map(async () => {
+    // the slot (context + page) outlives a channel; the browser lease does not
+    let entry = null;
+    let slot = null;
+    try {
+      while (next < channels.length) {
+        const i = next++;
+        const url = channelUrl(channels[i]);
+        let lease = null;
+        try {
+          lease = await pool.acquire();
+          if (lease !== entry || !slot || slot.page.isClosed()) {
+            if (slot) await slot.close();
+            slot = null;
+            entry = lease;
+            slot = await openSlot(entry.browser, opts);
+          }
+          results[i] = await resolveChannel(slot, url, opts);
+        } catch (err) {
+          results[i] = { page: url, streams: [], elapsed_ms: null, error: err && err.message ? err.message : String(err) };
+          // the page or browser may be gone; start over with a fresh slot
+          if (slot) await slot.close();
+          slot = null;
+        } finally {
+          if (lease) await pool.release(lease);
+        }
+        if (opts.onResult) opts.onResult(results[i]);
+      }
+    } finally {
+      if (slot) await slot.close();
+    }
+  });
+
+  try {
+    await Promise.all(workers);
+  } finally {
+    await pool.close();
+  }
+  return results;
+}
+
+module.exports = { BLOCKED_HOSTS, BLOCKED_TYPES, DEFAULTS, LEAN_ARGS, BrowserPool, extractLean, intArg, isBlockedHost };
@@ -0,0 +1,158 @@
+"""Production post-processing for generate.py output.
+
+productionize() takes the {relative path: text} map a builder produced and:
+
+- moves the inline <style>/<script> of index.html into assets/ files
+- minifies HTML, CSS and JS and re-serializes JSON compactly
+- fingerprints everything except the entry points (index.html, channels.json)
+  as assets/<name>.<hash>.<ext>, rewriting quoted references in dependency order
+- adds <link rel=preconnect> hints for the embed hosts
+
+write_files() writes the map and, when asked, .gz and .br siblings. Brotli
+output needs the optional `brotli` package; without it only .gz is written.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from urllib.parse import urlparse
+
+try:
+    import brotli
+except ImportError:  # optional: only needed for .br siblings
+    brotli = None
+
+ASSET_DIR = 'assets'
+# never renamed: the page entry point and the list other tools read
+STABLE_FILES = ('index.html', 'channels.json')
+COMPRESSIBLE = ('.html', '.css', '.js', '.json')
+HASH_LEN = 10
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    """Conservative JS minifier: drops comment-only lines, indentation and blank lines.
+
+    Lines are kept separate so automatic semicolon insertion still applies.
+    """
+    lines = []
+    for line in js.splitlines():
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def minify_html(html):
+    html = re.sub(r'>\s+<', '><', html)
+    html = re.sub(r'\n\s*', '\n', html)
+    return html.strip()
+
+
+def fingerprint(path, content):
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:HASH_LEN]
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return f'{ASSET_DIR}/{stem}.{digest}{ext}'
+
+
+def preconnect_origins(urls, limit=3):
+    """The most common origins among `urls`, most frequent first."""
+    counts = Counter()
+    for u in urls:
+        p = urlparse(u)
+        if p.scheme in ('http', 'https') and p.netloc:
+            counts[f'{p.scheme}://{p.netloc}'] += 1
+    return [o for o, _ in counts.most_common(limit)]
+
+
+def _replace_quoted(text, old, new):
+    return text.replace(f'"{old}"', f'"{new}"').replace(f"'{old}'", f"'{new}'")
+
+
+def productionize(files, origins=()):
+    """Return a new file map with minified, fingerprinted assets (see module docstring)."""
+    files = dict(files)
+    html = files['index.html']
+    style = re.search(r'<style>(.*?)</style>', html, re.S)
+    if style:
+        files[f'{ASSET_DIR}/app.css'] = style.group(1)
+        html = html.replace(style.group(0), f'<link rel="stylesheet" href="{ASSET_DIR}/app.css">')
+    script = re.search(r'<script>(.*?)</script>', html, re.S)
+    if script:
+        files[f'{ASSET_DIR}/app.js'] = script.group(1)
+        # defer keeps the script after parsing; onclick handlers only fire after load anyway
+        html = html.replace(script.group(0), f'<script src="{ASSET_DIR}/app.js" defer></script>')
+    hints = ''.join(f'<link rel="preconnect" href="{o}"><link rel="dns-prefetch" href="{o}">' for o in origins)
+    html = html.replace('<title>', hints + '<title>', 1)
+    files['index.html'] = html
+
+    for path, content in files.items():
+        if path.endswith('.css'):
+            files[path] = minify_css(content)
+        elif path.endswith('.js'):
+            files[path] = minify_js(content)
+        elif path.endswith('.html'):
+            files[path] = minify_html(content)
+        elif path.endswith('.json'):
+            files[path] = json.dumps(json.loads(content), separators=(',', ':'), ensure_ascii=False)
+
+    # fingerprint leaves first so a file's hash covers the final names it references
+    pending = [p for p in files if p not in STABLE_FILES]
+    while pending:
+        ready = [p for p in pending if not any(
+            q != p and (f'"{q}"' in files[p] or f"'{q}'" in files[p]) for q in pending)]
+        if not ready:
+            raise ValueError('circular asset references: ' + ', '.join(pending))
+        for path in ready:
+            new = fingerprint(path, files[path])
+            files[new] = files.pop(path)
+            pending.remove(path)
+            for other in files:
+                files[other] = _replace_quoted(files[other], path, new)
+    return files
+
+
+def transform_id():
+    """Identifies the production transform, for build hashes: this module's source
+    (minifiers, fingerprinting, preconnect hints) and whether .br output is possible."""
+    with open(__file__, 'rb') as fh:
+        digest = hashlib.sha256(fh.read()).hexdigest()[:HASH_LEN]
+    return f'{digest}+br' if brotli is not None else digest
+
+
+def write_files(outpath, files, compress=False):
+    """Write the file map under outpath, replacing any previous assets/ directory."""
+    asset_dir = os.path.join(outpath, ASSET_DIR)
+    if os.path.isdir(asset_dir):
+        for name in os.listdir(asset_dir):
+            os.remove(os.path.join(asset_dir, name))
+    if compress and brotli is None:
+        print('brotli not installed; writing .gz siblings only')
+    for rel, content in files.items():
+        path = os.path.join(outpath, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = content.encode('utf-8')
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        siblings = {}
+        if compress and rel.endswith(COMPRESSIBLE):
+            # mtime=0 keeps the .gz bytes stable across identical builds
+            siblings['.gz'] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                siblings['.br'] = brotli.compress(data, quality=11)
+        for ext in ('.gz', '.br'):
+            if ext in siblings:
+                with open(path + ext, 'wb') as fh:
+                    fh.write(siblings[ext])
+            elif os.path.exists(path + ext):
+                os.remove(path + ext)
+